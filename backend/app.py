@@ -15,6 +15,23 @@ from src.routes.admin_routes import admin_bp
 from src.routes.superadmin_routes import superadmin_bp
 from src.routes.module_unlock_routes import module_unlock_bp
 from src.services.seed import seed_initial_data
+from src.services.scheduler import register_job, start_scheduler
+from src.leaderboard_service import (
+    finalize_due_contests, CONTEST_FINALIZE_INTERVAL_SECONDS,
+    flush_dirty_ranks, rank_coalescing_enabled, RANK_RECOMPUTE_INTERVAL_SECONDS,
+    publish_pending_snapshots, LEADERBOARD_PUBLISH_INTERVAL_SECONDS,
+    reconcile_ranks, RANK_RECONCILE_INTERVAL_SECONDS,
+    ensure_instructor_views
+)
+from src.services.snapshot_queue import (
+    start_snapshot_workers, recover_snapshot_outbox, SNAPSHOT_RECOVER_INTERVAL_SECONDS
+)
+from src.services.xp_buckets import roll_over_xp_buckets, XP_BUCKET_ROLLOVER_INTERVAL_SECONDS
+from src.services.quantile_sketch import persist_sketches, SKETCH_PERSIST_INTERVAL_SECONDS
+from src.services.unlock_service import flush_heartbeats, HEARTBEAT_FLUSH_INTERVAL_SECONDS
+from src.services.progress_service import (
+    reconcile_attempt_counters, ATTEMPT_RECONCILE_INTERVAL_SECONDS
+)
 
 
 def create_app():
@@ -29,7 +46,7 @@ def create_app():
                 "https://*.vercel.app"  # All Vercel preview deployments
             ],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "X-Unlock-Grant"],
             "supports_credentials": True
         }
     })
@@ -41,11 +58,14 @@ def create_app():
     app.config['ALLOW_SUPER_ADMIN_REG'] = os.getenv('ALLOW_SUPER_ADMIN_REG', 'false').lower() == 'true'
 
     # Initialize DB (also creates indexes)
-    init_db()
+    db = init_db()
 
     # Seed initial course/modules (idempotent)
     seed_initial_data()
 
+    # Seed the per-instructor leaderboard views on first start (idempotent)
+    ensure_instructor_views(db)
+
     # ── Register Blueprints ───────────────────────────────────────────────────
     app.register_blueprint(auth_bp,           url_prefix='/api/auth')
     app.register_blueprint(course_bp,         url_prefix='/api')
@@ -60,6 +80,20 @@ def create_app():
     def health():
         return {'status': 'ok', 'version': '2.0'}
 
+    # ── Background jobs ───────────────────────────────────────────────────────
+    register_job('finalize-contests', CONTEST_FINALIZE_INTERVAL_SECONDS, finalize_due_contests)
+    register_job('reconcile-attempts', ATTEMPT_RECONCILE_INTERVAL_SECONDS, reconcile_attempt_counters)
+    register_job('recover-snapshots', SNAPSHOT_RECOVER_INTERVAL_SECONDS, recover_snapshot_outbox)
+    register_job('roll-over-xp-buckets', XP_BUCKET_ROLLOVER_INTERVAL_SECONDS, roll_over_xp_buckets)
+    register_job('persist-sketches', SKETCH_PERSIST_INTERVAL_SECONDS, persist_sketches)
+    register_job('publish-leaderboards', LEADERBOARD_PUBLISH_INTERVAL_SECONDS, publish_pending_snapshots)
+    register_job('reconcile-ranks', RANK_RECONCILE_INTERVAL_SECONDS, reconcile_ranks)
+    register_job('flush-heartbeats', HEARTBEAT_FLUSH_INTERVAL_SECONDS, flush_heartbeats)
+    if rank_coalescing_enabled():
+        register_job('flush-ranks', RANK_RECOMPUTE_INTERVAL_SECONDS, flush_dirty_ranks)
+    start_snapshot_workers()
+    start_scheduler(app)
+
     return app
 
 
@@ -0,0 +1,29 @@
+"""
+backfill_xp_buckets.py
+----------------------
+Builds the live weekly/monthly XP buckets (current and previous period) from
+historical quizAttempts.  Quiz submission maintains them with $inc from then
+on; run this once after deploying, or any time to repair drift.
+
+Safe to re-run: each (period, bucket, student) row is replaced.
+
+    python backfill_xp_buckets.py
+"""
+import sys, os
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.db import init_db
+from src.services.xp_buckets import backfill_xp_buckets
+
+
+def main():
+    db = init_db()
+    backfill_xp_buckets(db)
+    print(f"Backfill complete. Live bucket rows: {db.xpBuckets.count_documents({})}")
+
+
+if __name__ == '__main__':
+    main()
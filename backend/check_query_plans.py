@@ -0,0 +1,68 @@
+"""
+check_query_plans.py
+Asserts via explain() that the question queries issued by the API routes use
+an index scan, never a COLLSCAN.  Run against any database that has the app
+indexes (they are created on startup by init_db):
+
+    python check_query_plans.py
+
+Exits with status 1 if any query would scan the whole collection.
+"""
+import sys, os
+sys.path.append(os.getcwd())
+from bson import ObjectId
+from src.db import init_db
+
+
+def _stages(plan: dict):
+    """Yield every stage name in a (possibly nested) winning plan."""
+    if not isinstance(plan, dict):
+        return
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _stages(child)
+
+
+def _winning_plan(explain: dict) -> dict:
+    return explain['queryPlanner']['winningPlan']
+
+
+def main():
+    db  = init_db()
+    oid = ObjectId()   # plan shape does not depend on the value
+
+    checks = {
+        'quiz_routes.get_questions': db.questions.find(
+            {'moduleId': oid}, {'question': 1, 'options': 1}
+        ).explain(),
+        'quiz_routes.submit_quiz (grading)': db.questions.find(
+            {'moduleId': oid}, {'_id': 1, 'correctAnswer': 1}
+        ).explain(),
+        'admin_routes.get_module_questions': db.questions.find(
+            {'moduleId': oid}
+        ).explain(),
+        'admin_routes.delete_module': db.command({
+            'explain':   {'delete': 'questions', 'deletes': [{'q': {'moduleId': oid}, 'limit': 0}]},
+            'verbosity': 'queryPlanner'
+        }),
+        'contest question set ($or)': db.questions.find(
+            {'$or': [{'moduleId': {'$in': [oid]}}, {'contestId': oid}]}
+        ).explain(),
+    }
+
+    failed = False
+    for name, explain in checks.items():
+        stages = list(_stages(_winning_plan(explain)))
+        ok     = 'COLLSCAN' not in stages and any(s in ('IXSCAN', 'IDHACK') for s in stages)
+        failed = failed or not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {' <- '.join(stages)}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
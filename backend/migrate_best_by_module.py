@@ -0,0 +1,35 @@
+"""
+migrate_best_by_module.py
+-------------------------
+One-time backfill of users.bestByModule ({moduleId: best score ratio}) from
+historical quizAttempts.  Quiz submission maintains the map with $max from
+then on, and also backfills any student it finds without it, so running this
+is optional — it just avoids the one-off cost on each student's next submit.
+
+Safe to re-run: values are only ever raised with $max.
+
+    python migrate_best_by_module.py
+"""
+import sys, os
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.db import init_db
+from src.services.progress_service import backfill_best_by_module
+
+
+def main():
+    db = init_db()
+    missing = db.users.count_documents({'role': 'student', 'bestByModule': {'$exists': False}})
+    print(f"Students without bestByModule: {missing}")
+
+    backfill_best_by_module(db)
+
+    remaining = db.users.count_documents({'role': 'student', 'bestByModule': {'$exists': False}})
+    print(f"Backfill complete. Students still missing bestByModule: {remaining}")
+
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,41 @@ def decode_token(app, token: str) -> dict:
     return jwt.decode(token, secret, algorithms=[JWT_ALG])
 
 
+# ── Unlock grants ─────────────────────────────────────────────────────────────
+# A grant is a JWT proving that one student has unlocked one module's quiz.
+# Unlocks are permanent, so the quiz gate can trust a valid grant without
+# reading moduleUnlocks.  The audience claim keeps grants from ever being
+# accepted as a login token by get_current_user (and vice versa).  Grants are
+# short-lived, so a later reset of moduleUnlocks takes effect within
+# UNLOCK_GRANT_EXPIRES_MINUTES; the gate re-checks the DB and issues a new
+# grant once the old one expires.
+UNLOCK_GRANT_AUDIENCE        = 'module-unlock'
+UNLOCK_GRANT_HEADER          = 'X-Unlock-Grant'
+UNLOCK_GRANT_EXPIRES_MINUTES = int(os.getenv('UNLOCK_GRANT_EXPIRES_MINUTES', '240'))
+
+
+def create_unlock_grant(app, student_id: str, module_id: str) -> str:
+    return create_token(
+        app,
+        {'aud': UNLOCK_GRANT_AUDIENCE, 'uid': str(student_id), 'mid': str(module_id)},
+        expires_minutes=UNLOCK_GRANT_EXPIRES_MINUTES
+    )
+
+
+def verify_unlock_grant(app, token: str, student_id: str, module_id: str) -> bool:
+    """True if *token* is a valid, unexpired grant for exactly this student and module."""
+    if not token:
+        return False
+    try:
+        payload = jwt.decode(
+            token, app.config.get('JWT_SECRET'),
+            algorithms=[JWT_ALG], audience=UNLOCK_GRANT_AUDIENCE
+        )
+    except jwt.PyJWTError:
+        return False
+    return payload.get('uid') == str(student_id) and payload.get('mid') == str(module_id)
+
+
 def get_current_user():
     """Extract and decode the JWT from the Authorization header.
     Returns the decoded payload dict or None if missing/invalid."""
@@ -59,21 +59,91 @@ def _ensure_indexes(db):
         unique=True
     )
     db.contestLeaderboard.create_index([('contestId', ASCENDING)])
+    db.contestLeaderboard.create_index([('contestId', ASCENDING), ('isSubmitted', ASCENDING)])
+    # _id completes the ranking order, so keyset pages never need an in-memory sort
     db.contestLeaderboard.create_index([
         ('contestId', ASCENDING),
         ('score', DESCENDING),
-        ('timeTaken', ASCENDING)
+        ('timeTaken', ASCENDING),
+        ('_id', ASCENDING)
     ])
 
     # ── globalLeaderboard ─────────────────────────────────────────────────────
     db.globalLeaderboard.create_index([('studentId', ASCENDING)], unique=True)
     db.globalLeaderboard.create_index([('xp', DESCENDING), ('level', DESCENDING)])
+    # Full ranking order — backs the incremental rank shifts in leaderboard_service
+    db.globalLeaderboard.create_index([
+        ('xp', DESCENDING),
+        ('level', DESCENDING),
+        ('completedModulesCount', DESCENDING),
+        ('_id', ASCENDING)
+    ])
     db.globalLeaderboard.create_index([('rank', ASCENDING)])
 
+    # ── snapshotOutbox ────────────────────────────────────────────────────────
+    db.snapshotOutbox.create_index([('studentId', ASCENDING)], unique=True)
+    db.snapshotOutbox.create_index([('leaseUntil', ASCENDING)])
+
+    # ── instructorLeaderboard ─────────────────────────────────────────────────
+    db.instructorLeaderboard.create_index([('studentId', ASCENDING)], unique=True)
+    db.instructorLeaderboard.create_index([('instructorId', ASCENDING), ('cohortRank', ASCENDING)])
+    # Cohort ranking order — backs the incremental cohort rank shifts
+    db.instructorLeaderboard.create_index([
+        ('instructorId', ASCENDING),
+        ('xp', DESCENDING),
+        ('level', DESCENDING),
+        ('completedModulesCount', DESCENDING),
+        ('_id', ASCENDING)
+    ])
+    db.instructorLeaderboard.create_index([('xp', DESCENDING), ('level', DESCENDING)])
+
+    # ── xpBuckets / xpBucketArchive ───────────────────────────────────────────
+    db.xpBuckets.create_index(
+        [('period', ASCENDING), ('bucket', ASCENDING), ('studentId', ASCENDING)],
+        unique=True
+    )
+    db.xpBuckets.create_index([
+        ('period', ASCENDING),
+        ('bucket', ASCENDING),
+        ('xp', DESCENDING),
+        ('studentId', ASCENDING)
+    ])
+    db.xpBucketArchive.create_index(
+        [('period', ASCENDING), ('bucket', DESCENDING)],
+        unique=True
+    )
+
+    # ── leaderboardSnapshots ──────────────────────────────────────────────────
+    db.leaderboardSnapshots.create_index(
+        [('board', ASCENDING), ('version', DESCENDING)],
+        unique=True
+    )
+
     # ── contests ──────────────────────────────────────────────────────────────
     db.contests.create_index([('createdBy', ASCENDING)])
     db.contests.create_index([('startTime', ASCENDING)])
 
+    # ── questions ─────────────────────────────────────────────────────────────
+    # (moduleId, _id, correctAnswer) serves every moduleId filter via its
+    # prefix and covers the grading projection {_id, correctAnswer}.
+    # `options` is an array, so no index can cover {question, options}.
+    db.questions.create_index([
+        ('moduleId', ASCENDING),
+        ('_id', ASCENDING),
+        ('correctAnswer', ASCENDING)
+    ])
+    # Only custom contest questions carry contestId
+    db.questions.create_index(
+        [('contestId', ASCENDING)],
+        partialFilterExpression={'contestId': {'$exists': True}}
+    )
+
+    # ── contestQuestionSets ───────────────────────────────────────────────────
+    db.contestQuestionSets.create_index(
+        [('contestId', ASCENDING), ('version', DESCENDING)],
+        unique=True
+    )
+
     # ── modules ───────────────────────────────────────────────────────────────
     db.modules.create_index([('courseId', ASCENDING), ('moduleNo', ASCENDING)])
 
@@ -2,20 +2,62 @@
 leaderboard_service.py
 Centralised helpers for updating and rebuilding leaderboard collections.
 Called from quiz_routes (on every quiz submit) and superadmin_routes (manual rebuild).
+
+Global ranks are served from an in-process order-statistic index (RankIndex)
+built from globalLeaderboard, so rank-of-student and top-K reads are O(log N)
+and never depend on the stored `rank` field being fresh.
+
+Stored `rank` / `cohortRank` fields are moved incrementally, one move at a
+time per board (services/board_lock.py), and re-derived from a full sort by
+the reconcile_ranks job as a safety net.
+
+With RANK_RECOMPUTE_INTERVAL_SECONDS > 0 the stored `rank` fields are not
+written per submission: boards are marked dirty and re-ranked at most once per
+interval (or after RANK_RECOMPUTE_MAX_CHANGES changes) by flush_dirty_ranks.
+
+The public top-100 is served from versioned `leaderboardSnapshots` documents:
+each publish builds the whole ranked list off to the side and inserts it as
+one new version, so readers (one indexed read) never see a half-ranked board.
 """
+import os
+import time
 import datetime
+import threading
+from contextlib import nullcontext
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne, ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from src.models import BADGE_CONTEST_WINNER
+from src.services.rank_index import RankIndex
+from src.services.quantile_sketch import record_xp_change, reset_xp_sketch
+from src.services.response_cache import invalidate_board
+from src.services.board_lock import board_lock
+from src.services import rank_events
+
+# Rebuild the in-process index from Mongo at least this often, so that
+# updates made by other worker processes become visible
+GLOBAL_INDEX_REFRESH_SECONDS = int(os.getenv('GLOBAL_INDEX_REFRESH_SECONDS', '60'))
+
+# Board name of the global leaderboard (contest boards use the contest id)
+GLOBAL_BOARD = 'global'
+
+# Lock name shared by every instructor cohort (a move can span two cohorts)
+COHORT_BOARD = 'cohorts'
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Update a single student's snapshot in userProgress + globalLeaderboard
 # ─────────────────────────────────────────────────────────────────────────────
-def update_student_snapshots(db, student_id: ObjectId):
+def update_student_snapshots(db, student_id: ObjectId, user: dict = None):
     """
-    Recompute and persist the userProgress + globalLeaderboard snapshot for one student.
+    Recompute and persist the userProgress + globalLeaderboard (+ instructor
+    cohort) snapshot for one student.
     Called after every quiz submission to keep the data fresh.
+    Pass *user* (the already-updated users document) to skip re-reading it.
     """
-    user = db.users.find_one({'_id': student_id})
+    if user is None:
+        user = db.users.find_one({'_id': student_id})
     if not user:
         return
 
@@ -31,7 +73,7 @@ def update_student_snapshots(db, student_id: ObjectId):
         'badges':               user.get('badges', []),
         'completedModulesCount': len(user.get('completedModules', [])),
         'completedModules':     user.get('completedModules', []),
-        'totalAttempts':        db.quizAttempts.count_documents({'studentId': student_id}),
+        'totalAttempts':        user.get('totalAttempts', 0),
         'lastActiveAt':         now,
         'updatedAt':            now
     }
@@ -53,69 +95,1092 @@ def update_student_snapshots(db, student_id: ObjectId):
         'updatedAt':            now
     }
 
-    db.globalLeaderboard.update_one(
-        {'studentId': student_id},
-        {'$set': lb_doc},
-        upsert=True
+    # Rank before the move, only needed for live SSE subscribers
+    watching = rank_events.has_subscribers(GLOBAL_BOARD)
+    old_rank = global_rank_of(db, student_id) if watching else None
+
+    coalescing = rank_coalescing_enabled()
+    with _rank_move_lock(db, GLOBAL_BOARD, coalescing):
+        previous = db.globalLeaderboard.find_one_and_update(
+            {'studentId': student_id},
+            {'$set': lb_doc},
+            projection=_RANK_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            current = db.globalLeaderboard.find_one({'studentId': student_id}, _RANK_PROJECTION)
+        else:
+            current = {**previous, **lb_doc}
+        if not coalescing:
+            # Move only this student's entry (falls back to a full re-rank if
+            # the stored ranks cannot be trusted)
+            _apply_global_rank_move(db, previous, current)
+    record_xp_change(db, previous.get('xp', 0) if previous else None, lb_doc['xp'])
+    if coalescing:
+        mark_rank_dirty(db, GLOBAL_BOARD)
+
+    if _global_index is not None:
+        _index_global_entry(_global_index, {**lb_doc, '_id': current['_id']})
+    mark_unpublished(GLOBAL_BOARD)
+
+    if watching:
+        rank_events.publish(GLOBAL_BOARD, 'move', {
+            'studentId':    student_id,
+            'studentName':  lb_doc['studentName'],
+            'xp':           lb_doc['xp'],
+            'level':        lb_doc['level'],
+            'previousRank': old_rank,
+            'rank':         global_rank_of(db, student_id)
+        })
+
+    update_instructor_view(db, student_id, user, now)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Global leaderboard ordering
+# ─────────────────────────────────────────────────────────────────────────────
+# Ranking order: xp DESC, level DESC, completedModulesCount DESC, then the
+# entry _id ASC so that ties always resolve the same way.  Both the full
+# re-rank and the incremental move use this exact order, which is what makes
+# the incremental result identical to a full sort.
+_RANK_PROJECTION = {'_id': 1, 'xp': 1, 'level': 1, 'completedModulesCount': 1, 'rank': 1}
+
+
+def _rank_key(entry: dict) -> tuple:
+    """Python sort key matching the global leaderboard order."""
+    return (
+        -entry.get('xp', 0),
+        -entry.get('level', 1),
+        -entry.get('completedModulesCount', 0),
+        entry['_id']
     )
 
-    # Recompute ranks across all students
-    _recompute_global_ranks(db)
+
+def _ranked_before(entry: dict) -> dict:
+    """Mongo filter for every entry that sorts strictly ahead of *entry*."""
+    xp    = entry.get('xp', 0)
+    level = entry.get('level', 1)
+    cmc   = entry.get('completedModulesCount', 0)
+    return {'$or': [
+        {'xp': {'$gt': xp}},
+        {'xp': xp, 'level': {'$gt': level}},
+        {'xp': xp, 'level': level, 'completedModulesCount': {'$gt': cmc}},
+        {'xp': xp, 'level': level, 'completedModulesCount': cmc, '_id': {'$lt': entry['_id']}},
+    ]}
+
+
+def _ranked_after(entry: dict) -> dict:
+    """Mongo filter for every entry that sorts strictly behind *entry*."""
+    xp    = entry.get('xp', 0)
+    level = entry.get('level', 1)
+    cmc   = entry.get('completedModulesCount', 0)
+    return {'$or': [
+        {'xp': {'$lt': xp}},
+        {'xp': xp, 'level': {'$lt': level}},
+        {'xp': xp, 'level': level, 'completedModulesCount': {'$lt': cmc}},
+        {'xp': xp, 'level': level, 'completedModulesCount': cmc, '_id': {'$gt': entry['_id']}},
+    ]}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Incremental rank maintenance
+# ─────────────────────────────────────────────────────────────────────────────
+def _apply_global_rank_move(db, previous, current):
+    """Re-position a single globalLeaderboard entry after its sort key changed
+    (falls back to a full re-rank if the stored ranks cannot be trusted)."""
+    if current is None:
+        return
+    if not _shift_ranks(db.globalLeaderboard, previous, current):
+        _recompute_global_ranks(db)
+
+
+def _rank_move_lock(db, board, coalescing: bool = False):
+    """board_lock for an incremental move; coalesced boards skip per-change moves."""
+    return nullcontext() if coalescing else board_lock(db, board)
+
+
+def _scoped(scope, *filters) -> dict:
+    """AND the filters together, restricted to *scope* (None = whole collection)."""
+    clauses = ([scope] if scope else []) + list(filters)
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def _shift_ranks(coll, previous, current, field: str = 'rank', scope: dict = None) -> bool:
+    """
+    Move one entry of a ranked collection (or of the *scope* subset of it).
+
+    Assuming ranks 1..N were consistent with _rank_key before the change,
+    moving one entry only shifts the entries it passed by exactly one place:
+      - moved up   → entries between new and old position get rank + 1
+      - moved down → entries between old and new position get rank - 1
+      - new entry  → every entry behind it gets rank + 1
+    Everything else keeps its rank, so the result equals a full re-sort.
+    Moves must be serialized per board (board_lock) — the key write and the
+    shift of two concurrent moves would otherwise count each other.
+    Returns False for a legacy entry without a stored rank (caller re-ranks).
+    """
+    if previous is None or previous.get(field) is None:
+        if previous is not None:
+            return False
+        coll.update_many(_scoped(scope, _ranked_after(current)), {'$inc': {field: 1}})
+        new_rank = coll.count_documents(_scoped(scope, _ranked_before(current))) + 1
+        coll.update_one({'_id': current['_id']}, {'$set': {field: new_rank}})
+        return True
+
+    old_key  = _rank_key(previous)
+    new_key  = _rank_key(current)
+    old_rank = previous[field]
+
+    if new_key == old_key:
+        return True
+
+    if new_key < old_key:
+        # Moved up: everyone it overtook drops one place
+        passed = coll.update_many(
+            _scoped(scope, _ranked_after(current), _ranked_before(previous)),
+            {'$inc': {field: 1}}
+        )
+        new_rank = old_rank - passed.matched_count
+    else:
+        # Moved down: everyone that overtook it climbs one place
+        passed = coll.update_many(
+            _scoped(scope, _ranked_after(previous), _ranked_before(current)),
+            {'$inc': {field: -1}}
+        )
+        new_rank = old_rank + passed.matched_count
+
+    coll.update_one({'_id': current['_id']}, {'$set': {field: new_rank}})
+    return True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  In-process global rank index
+# ─────────────────────────────────────────────────────────────────────────────
+_INDEX_PROJECTION = {
+    '_id': 1, 'studentId': 1, 'studentName': 1, 'instructorId': 1,
+    'xp': 1, 'level': 1, 'completedModulesCount': 1
+}
+
+_global_index           = None
+_global_index_loaded_at = 0.0
+_global_index_lock      = threading.Lock()
+
+
+def _index_global_entry(index: RankIndex, entry: dict):
+    index.upsert(entry['studentId'], _rank_key(entry), {
+        'studentId':             entry['studentId'],
+        'studentName':           entry.get('studentName', ''),
+        'instructorId':          entry.get('instructorId'),
+        'xp':                    entry.get('xp', 0),
+        'level':                 entry.get('level', 1),
+        'completedModulesCount': entry.get('completedModulesCount', 0)
+    })
+
+
+def get_global_rank_index(db) -> RankIndex:
+    """Return the process-wide rank index, (re)building it from globalLeaderboard
+    when it is missing or older than GLOBAL_INDEX_REFRESH_SECONDS."""
+    global _global_index, _global_index_loaded_at
+
+    if (_global_index is not None and
+            time.monotonic() - _global_index_loaded_at < GLOBAL_INDEX_REFRESH_SECONDS):
+        return _global_index
+
+    with _global_index_lock:
+        if (_global_index is None or
+                time.monotonic() - _global_index_loaded_at >= GLOBAL_INDEX_REFRESH_SECONDS):
+            index = RankIndex()
+            for entry in db.globalLeaderboard.find({}, _INDEX_PROJECTION):
+                _index_global_entry(index, entry)
+            _global_index           = index
+            _global_index_loaded_at = time.monotonic()
+    return _global_index
+
+
+def invalidate_global_rank_index():
+    """Drop the in-process index; the next read rebuilds it."""
+    global _global_index
+    _global_index = None
+
+
+def global_top(db, k: int = 100, offset: int = 0) -> list:
+    """Top-K global entries as dicts with a read-time `rank`."""
+    return [
+        {**value, 'rank': rank}
+        for rank, _member, value in get_global_rank_index(db).top(k, offset)
+    ]
+
+
+def global_rank_of(db, student_id: ObjectId):
+    """Current global rank of one student (None if not on the leaderboard)."""
+    return get_global_rank_index(db).rank_of(student_id)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Published global snapshots
+# ─────────────────────────────────────────────────────────────────────────────
+# leaderboardSnapshots: { board, version, entries: [top N with rank], total,
+# publishedAt }.  A snapshot is complete before it is inserted, and a single
+# insert is atomic, so the highest version is always a consistent board.
+# Publishing runs from the scheduler (publish_pending_snapshots), after a
+# coalesced rank flush and after a rebuild; the previous version is kept for
+# readers that already picked it.
+LEADERBOARD_SNAPSHOT_SIZE            = int(os.getenv('LEADERBOARD_SNAPSHOT_SIZE', '100'))
+LEADERBOARD_PUBLISH_INTERVAL_SECONDS = int(os.getenv('LEADERBOARD_PUBLISH_INTERVAL_SECONDS', '5'))
+
+_unpublished      = set()       # boards changed since this process last published
+_unpublished_lock = threading.Lock()
+
+
+def mark_unpublished(board):
+    with _unpublished_lock:
+        _unpublished.add(board)
+
+
+PUBLISH_ATTEMPTS = 3
+
+
+def _global_snapshot_entries(db) -> list:
+    """The global top-N, ranked by the sort itself (never by stored `rank` fields)."""
+    # Sorted by the full ranking order (backed by the compound index)
+    cursor = db.globalLeaderboard.find({}, _INDEX_PROJECTION).sort([
+        ('xp', DESCENDING), ('level', DESCENDING),
+        ('completedModulesCount', DESCENDING), ('_id', ASCENDING)
+    ]).limit(LEADERBOARD_SNAPSHOT_SIZE)
+    return [
+        {
+            'rank':                  rank,
+            'studentId':             e['studentId'],
+            'studentName':           e.get('studentName', ''),
+            'instructorId':          e.get('instructorId'),
+            'xp':                    e.get('xp', 0),
+            'level':                 e.get('level', 1),
+            'completedModulesCount': e.get('completedModulesCount', 0)
+        }
+        for rank, e in enumerate(cursor, start=1)
+    ]
+
+
+def publish_global_snapshot(db) -> dict:
+    """
+    Rank the global top-N from globalLeaderboard and publish it as a new version.
+
+    Publishers are serialized by a board_lock, and each one picks its version
+    before reading the rows, so a higher version is never built from older
+    data.  Should a lapsed lease still let two publishers collide on a version,
+    the loser re-reads both and tries again.
+    """
+    with _unpublished_lock:
+        _unpublished.discard(GLOBAL_BOARD)   # changes from here on mark it again
+    try:
+        with board_lock(db, f'publish:{GLOBAL_BOARD}'):
+            for attempt in range(PUBLISH_ATTEMPTS):
+                latest  = db.leaderboardSnapshots.find_one(
+                    {'board': GLOBAL_BOARD}, {'version': 1}, sort=[('version', -1)]
+                )
+                version  = (latest['version'] if latest else 0) + 1
+                snapshot = {
+                    'board':       GLOBAL_BOARD,
+                    'version':     version,
+                    'entries':     _global_snapshot_entries(db),
+                    'total':       db.globalLeaderboard.estimated_document_count(),
+                    'publishedAt': datetime.datetime.utcnow()
+                }
+                try:
+                    db.leaderboardSnapshots.insert_one(snapshot)
+                    break
+                except DuplicateKeyError:
+                    if attempt == PUBLISH_ATTEMPTS - 1:
+                        raise
+    except Exception:
+        # Keep the board pending so the next scheduler run publishes it
+        mark_unpublished(GLOBAL_BOARD)
+        raise
+
+    db.leaderboardSnapshots.delete_many({'board': GLOBAL_BOARD, 'version': {'$lt': version - 1}})
+    invalidate_board(GLOBAL_BOARD)
+    return snapshot
+
+
+def publish_pending_snapshots(db) -> int:
+    """Publish the boards this process changed since its last publish.  Scheduled job."""
+    with _unpublished_lock:
+        pending = GLOBAL_BOARD in _unpublished
+    if pending:
+        publish_global_snapshot(db)
+    return int(pending)
+
+
+def published_global_top(db) -> list:
+    """Entries of the newest published global snapshot (publishes one if none exists)."""
+    snapshot = db.leaderboardSnapshots.find_one(
+        {'board': GLOBAL_BOARD}, {'entries': 1}, sort=[('version', -1)]
+    )
+    if snapshot is None:
+        snapshot = publish_global_snapshot(db)
+    return snapshot['entries']
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Recompute ranks for the global leaderboard
 # ─────────────────────────────────────────────────────────────────────────────
 def _recompute_global_ranks(db):
-    """Sort all entries by (xp DESC, level DESC, completedModulesCount DESC)
-    and assign rank 1, 2, 3, ..."""
-    entries = list(db.globalLeaderboard.find(
-        {},
-        {'_id': 1, 'xp': 1, 'level': 1, 'completedModulesCount': 1}
-    ))
-
-    entries.sort(key=lambda e: (
-        -e.get('xp', 0),
-        -e.get('level', 1),
-        -e.get('completedModulesCount', 0)
-    ))
-
-    for rank, entry in enumerate(entries, start=1):
-        db.globalLeaderboard.update_one(
-            {'_id': entry['_id']},
-            {'$set': {'rank': rank}}
+    """Sort all entries by (xp DESC, level DESC, completedModulesCount DESC, _id ASC)
+    and assign rank 1, 2, 3, ... — only entries whose rank changed are written."""
+    entries = list(db.globalLeaderboard.find({}, _RANK_PROJECTION))
+    entries.sort(key=_rank_key)
+
+    ops = [
+        UpdateOne({'_id': entry['_id']}, {'$set': {'rank': rank}})
+        for rank, entry in enumerate(entries, start=1)
+        if entry.get('rank') != rank
+    ]
+    if ops:
+        db.globalLeaderboard.bulk_write(ops, ordered=False)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Periodic reconcile
+# ─────────────────────────────────────────────────────────────────────────────
+# Safety net behind board_lock: a move applied after its lease lapsed (a very
+# slow or paused holder) can still leave a torn rank, so every stored rank is
+# re-derived from a full sort on this interval.  Only rows whose rank differs
+# are written, so a consistent board costs one read.
+RANK_RECONCILE_INTERVAL_SECONDS = int(os.getenv('RANK_RECONCILE_INTERVAL_SECONDS', '600'))
+RANK_RECONCILE_LEASE_SECONDS    = float(os.getenv('RANK_RECONCILE_LEASE_SECONDS', '120'))
+
+
+def reconcile_ranks(db) -> int:
+    """Full re-rank of the global board and every cohort.  Scheduled job;
+    returns the number of cohorts checked."""
+    with board_lock(db, GLOBAL_BOARD, RANK_RECONCILE_LEASE_SECONDS):
+        _recompute_global_ranks(db)
+    with board_lock(db, COHORT_BOARD, RANK_RECONCILE_LEASE_SECONDS):
+        instructors = db.instructorLeaderboard.distinct('instructorId')
+        for instructor_id in instructors:
+            _recompute_cohort_ranks(db, instructor_id)
+    return len(instructors)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Per-instructor cohort leaderboards
+# ─────────────────────────────────────────────────────────────────────────────
+# instructorLeaderboard holds one row per student (keyed by studentId) with
+# the dashboard fields and `cohortRank` — the student's rank among students
+# of the same instructorId, in the global ranking order.  Cohort ranks are
+# moved incrementally with _shift_ranks scoped to the instructor.
+_COHORT_PROJECTION = {**_RANK_PROJECTION, 'instructorId': 1, 'cohortRank': 1}
+
+
+def _cohort_doc(student_id: ObjectId, user: dict, now) -> dict:
+    return {
+        'studentId':             student_id,
+        'instructorId':          user.get('instructorId'),
+        'name':                  user['name'],
+        'xp':                    user.get('xp', 0),
+        'level':                 user.get('level', 1),
+        'badges':                user.get('badges', []),
+        'completedModulesCount': len(user.get('completedModules', [])),
+        'totalAttempts':         user.get('totalAttempts', 0),
+        'lastActiveAt':          now,
+        'updatedAt':             now
+    }
+
+
+def _leave_cohort(db, entry: dict):
+    """Close the gap an entry leaves behind in its (old) cohort."""
+    if entry.get('cohortRank') is None:
+        return
+    db.instructorLeaderboard.update_many(
+        _scoped({'instructorId': entry.get('instructorId')}, _ranked_after(entry)),
+        {'$inc': {'cohortRank': -1}}
+    )
+
+
+def _place_in_cohort(db, previous, current):
+    """Apply one row change (score and/or instructor) to the cohort ranks."""
+    moved = previous is not None and previous.get('instructorId') != current.get('instructorId')
+    if moved:
+        _leave_cohort(db, previous)
+        previous = None       # joins the new cohort as a new entry
+    scope = {'instructorId': current.get('instructorId')}
+    if not _shift_ranks(db.instructorLeaderboard, previous, current, 'cohortRank', scope):
+        _recompute_cohort_ranks(db, current.get('instructorId'))
+
+
+def _recompute_cohort_ranks(db, instructor_id):
+    """Full re-rank of one cohort — only entries whose rank changed are written."""
+    entries = list(db.instructorLeaderboard.find({'instructorId': instructor_id}, _COHORT_PROJECTION))
+    entries.sort(key=_rank_key)
+    ops = [
+        UpdateOne({'_id': e['_id']}, {'$set': {'cohortRank': rank}})
+        for rank, e in enumerate(entries, start=1)
+        if e.get('cohortRank') != rank
+    ]
+    if ops:
+        db.instructorLeaderboard.bulk_write(ops, ordered=False)
+
+
+def update_instructor_view(db, student_id: ObjectId, user: dict, now=None):
+    """Upsert one student's instructorLeaderboard row and move their cohort rank."""
+    doc = _cohort_doc(student_id, user, now or datetime.datetime.utcnow())
+    with board_lock(db, COHORT_BOARD):
+        previous = db.instructorLeaderboard.find_one_and_update(
+            {'studentId': student_id},
+            {'$set': doc},
+            projection=_COHORT_PROJECTION,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            current = db.instructorLeaderboard.find_one({'studentId': student_id}, _COHORT_PROJECTION)
+        else:
+            current = {**previous, **doc}
+        _place_in_cohort(db, previous, current)
+
+
+_ANY_INSTRUCTOR = object()
+
+
+def move_student_cohort(db, student_id: ObjectId, instructor_id, expected_instructor=_ANY_INSTRUCTOR):
+    """
+    Re-home a student's row after assign/unassign (no-op before their first snapshot).
+    With *expected_instructor* the row only moves if it is still in that cohort,
+    so an unassign can't undo a re-assign that happened in the meantime.
+    """
+    query = {'studentId': student_id}
+    if expected_instructor is not _ANY_INSTRUCTOR:
+        query['instructorId'] = expected_instructor
+    with board_lock(db, COHORT_BOARD):
+        previous = db.instructorLeaderboard.find_one_and_update(
+            query,
+            {'$set': {'instructorId': instructor_id}},
+            projection=_COHORT_PROJECTION,
+            return_document=ReturnDocument.BEFORE
         )
+        if previous is None or previous.get('instructorId') == instructor_id:
+            return
+        _place_in_cohort(db, previous, {**previous, 'instructorId': instructor_id})
+
+
+def instructor_cohort(db, instructor_id) -> list:
+    """All rows of one cohort in cohortRank order — one query on (instructorId, cohortRank)."""
+    return list(
+        db.instructorLeaderboard.find({'instructorId': instructor_id})
+          .sort([('cohortRank', ASCENDING)])
+    )
+
+
+def ensure_instructor_views(db):
+    """Seed instructorLeaderboard from userProgress when it is still empty
+    (first start after upgrading).  Idempotent; run at app startup."""
+    if db.instructorLeaderboard.estimated_document_count() > 0:
+        return
+    if db.userProgress.estimated_document_count() == 0:
+        return
+    db.userProgress.aggregate(_instructor_view_pipeline(), allowDiskUse=True)
+    db.instructorLeaderboard.aggregate(_cohort_rank_pipeline(), allowDiskUse=True)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Full rebuild — used on demand by Super Admin
 # ─────────────────────────────────────────────────────────────────────────────
-def rebuild_global_leaderboard(db):
-    """Rebuild globalLeaderboard from scratch using live users data."""
-    students = list(db.users.find({'role': 'student'}))
-    for student in students:
-        update_student_snapshots(db, student['_id'])
+REBUILD_MODE_AGGREGATE = 'aggregate'
+REBUILD_MODE_ITERATIVE = 'iterative'
+
+
+def rebuild_global_leaderboard(db, mode: str = REBUILD_MODE_AGGREGATE):
+    """
+    Rebuild userProgress + globalLeaderboard from scratch using live users data.
+
+    mode='aggregate' (default) runs entirely server-side: five aggregation
+    pipelines, independent of the number of students (MongoDB 5.0+ for
+    $setWindowFields and correlated $lookup).
+    mode='iterative' is the old per-student loop, kept for older servers.
+    """
+    if mode == REBUILD_MODE_ITERATIVE:
+        students = list(db.users.find({'role': 'student'}, {'_id': 1}))
+        for student in students:
+            update_student_snapshots(db, student['_id'])
+    else:
+        db.users.aggregate(_user_progress_pipeline(), allowDiskUse=True)
+        db.users.aggregate(_global_snapshot_pipeline(), allowDiskUse=True)
+        db.globalLeaderboard.aggregate(_global_rank_pipeline(), allowDiskUse=True)
+        db.userProgress.aggregate(_instructor_view_pipeline(), allowDiskUse=True)
+        db.instructorLeaderboard.aggregate(_cohort_rank_pipeline(), allowDiskUse=True)
+    invalidate_global_rank_index()
+    publish_global_snapshot(db)
+    reset_xp_sketch(db)
+    rank_events.publish(GLOBAL_BOARD, 'resync', {})
+
+
+def _user_progress_pipeline() -> list:
+    """users ⋈ per-student quizAttempts count → userProgress."""
+    return [
+        {'$match': {'role': 'student'}},
+        {'$lookup': {
+            'from':         'quizAttempts',
+            'localField':   '_id',
+            'foreignField': 'studentId',
+            'pipeline':     [{'$count': 'n'}],
+            'as':           'attemptStats'
+        }},
+        {'$set': {
+            'xp':               {'$ifNull': ['$xp', 0]},
+            'level':            {'$ifNull': ['$level', 1]},
+            'badges':           {'$ifNull': ['$badges', []]},
+            'completedModules': {'$ifNull': ['$completedModules', []]},
+            'instructorId':     {'$ifNull': ['$instructorId', None]},
+        }},
+        {'$project': {
+            '_id':                   0,
+            'studentId':             '$_id',
+            'instructorId':          1,
+            'name':                  1,
+            'xp':                    1,
+            'level':                 1,
+            'badges':                1,
+            'completedModulesCount': {'$size': '$completedModules'},
+            'completedModules':      1,
+            'totalAttempts':         {'$ifNull': [{'$first': '$attemptStats.n'}, 0]},
+            'lastActiveAt':          '$$NOW',
+            'updatedAt':             '$$NOW'
+        }},
+        {'$merge': {
+            'into':           'userProgress',
+            'on':             'studentId',
+            'whenMatched':    'merge',
+            'whenNotMatched': 'insert'
+        }},
+    ]
+
+
+def _global_snapshot_pipeline() -> list:
+    """users → globalLeaderboard (without ranks)."""
+    return [
+        {'$match': {'role': 'student'}},
+        {'$project': {
+            '_id':                   0,
+            'studentId':             '$_id',
+            'studentName':           '$name',
+            'instructorId':          {'$ifNull': ['$instructorId', None]},
+            'xp':                    {'$ifNull': ['$xp', 0]},
+            'level':                 {'$ifNull': ['$level', 1]},
+            'completedModulesCount': {'$size': {'$ifNull': ['$completedModules', []]}},
+            'updatedAt':             '$$NOW'
+        }},
+        {'$merge': {
+            'into':           'globalLeaderboard',
+            'on':             'studentId',
+            'whenMatched':    'merge',
+            'whenNotMatched': 'insert'
+        }},
+    ]
+
+
+def _global_rank_pipeline() -> list:
+    """Assign ranks in the same order as _rank_key and write them back in place."""
+    return [
+        {'$setWindowFields': {
+            'sortBy': {'xp': -1, 'level': -1, 'completedModulesCount': -1, '_id': 1},
+            'output': {'rank': {'$documentNumber': {}}}
+        }},
+        {'$project': {'_id': 1, 'rank': 1}},
+        {'$merge': {
+            'into':           'globalLeaderboard',
+            'on':             '_id',
+            'whenMatched':    'merge',
+            'whenNotMatched': 'discard'
+        }},
+    ]
+
+
+def _instructor_view_pipeline() -> list:
+    """userProgress → instructorLeaderboard (without cohort ranks)."""
+    return [
+        {'$project': {
+            '_id':                   0,
+            'studentId':             1,
+            'instructorId':          {'$ifNull': ['$instructorId', None]},
+            'name':                  1,
+            'xp':                    1,
+            'level':                 1,
+            'badges':                1,
+            'completedModulesCount': 1,
+            'totalAttempts':         1,
+            'lastActiveAt':          1,
+            'updatedAt':             1
+        }},
+        {'$merge': {
+            'into':           'instructorLeaderboard',
+            'on':             'studentId',
+            'whenMatched':    'merge',
+            'whenNotMatched': 'insert'
+        }},
+    ]
+
+
+def _cohort_rank_pipeline() -> list:
+    """Assign cohortRank within each instructorId, in _rank_key order."""
+    return [
+        {'$setWindowFields': {
+            'partitionBy': '$instructorId',
+            'sortBy':      {'xp': -1, 'level': -1, 'completedModulesCount': -1, '_id': 1},
+            'output':      {'cohortRank': {'$documentNumber': {}}}
+        }},
+        {'$project': {'_id': 1, 'cohortRank': 1}},
+        {'$merge': {
+            'into':           'instructorLeaderboard',
+            'on':             '_id',
+            'whenMatched':    'merge',
+            'whenNotMatched': 'discard'
+        }},
+    ]
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  Contest leaderboard helpers
 # ─────────────────────────────────────────────────────────────────────────────
-def update_contest_ranks(db, contest_id: ObjectId):
-    """Sort and persist ranks within a single contest's leaderboard."""
-    entries = list(db.contestLeaderboard.find(
-        {'contestId': contest_id, 'isSubmitted': True},
-        {'_id': 1, 'score': 1, 'timeTaken': 1}
-    ))
-
-    entries.sort(key=lambda e: (
-        -e.get('score', 0),
-        e.get('timeTaken', 0)   # faster time wins on tie
-    ))
-
-    for rank, entry in enumerate(entries, start=1):
-        db.contestLeaderboard.update_one(
-            {'_id': entry['_id']},
-            {'$set': {'rank': rank}}
+# One RankIndex per contest, ordered by (score DESC, timeTaken ASC, _id ASC).
+# Each node's value carries the rank last persisted to Mongo, so a submission
+# only writes the entries whose rank actually moved.
+CONTEST_RANK_BATCH_SIZE = int(os.getenv('CONTEST_RANK_BATCH_SIZE', '500'))
+
+_CONTEST_PROJECTION = {'_id': 1, 'studentId': 1, 'score': 1, 'timeTaken': 1, 'rank': 1}
+
+_contest_indexes      = {}      # contestId → RankIndex
+_contest_locks        = {}      # contestId → (index lock, write lock)
+_contest_indexes_lock = threading.Lock()    # guards the two dicts only
+
+
+def _locks_for_contest(contest_id: ObjectId) -> tuple:
+    """
+    The per-contest (index lock, write lock) pair.  The index lock covers
+    in-memory changes to the contest's RankIndex and never spans Mongo I/O;
+    the write lock orders the resulting bulk_writes.  It is taken before the
+    index lock is released, so rank writes land in the order they were computed.
+    """
+    with _contest_indexes_lock:
+        locks = _contest_locks.get(contest_id)
+        if locks is None:
+            locks = _contest_locks[contest_id] = (threading.Lock(), threading.Lock())
+        return locks
+
+
+def _contest_rank_key(entry: dict) -> tuple:
+    return (
+        -entry.get('score', 0),
+        entry.get('timeTaken', 0),   # faster time wins on tie
+        entry['_id']
+    )
+
+
+def _index_contest_entry(index: RankIndex, entry: dict):
+    index.upsert(entry['studentId'], _contest_rank_key(entry), {
+        '_id':       entry['_id'],
+        'studentId': entry['studentId'],
+        'score':     entry.get('score', 0),
+        'timeTaken': entry.get('timeTaken', 0),
+        'rank':      entry.get('rank')
+    })
+
+
+def _load_contest_index(db, contest_id: ObjectId) -> RankIndex:
+    index = RankIndex()
+    for entry in db.contestLeaderboard.find(
+        {'contestId': contest_id, 'isSubmitted': True}, _CONTEST_PROJECTION
+    ):
+        _index_contest_entry(index, entry)
+    return index
+
+
+def _synced_contest_index(db, contest_id: ObjectId, pending=None):
+    """
+    Return (index, reloaded) for one contest, loading it on first use.
+    The index is reloaded whenever its size disagrees with the number of
+    submitted entries in Mongo (e.g. submissions handled by another worker).
+    *pending* is a studentId whose submission is stored but not indexed yet.
+    """
+    submitted = db.contestLeaderboard.count_documents(
+        {'contestId': contest_id, 'isSubmitted': True}
+    )
+    index_lock, _write_lock = _locks_for_contest(contest_id)
+    with index_lock:
+        index = _contest_indexes.get(contest_id)
+        if index is not None:
+            expected = len(index) + (1 if pending is not None and pending not in index else 0)
+            if expected == submitted:
+                return index, False
+
+    # Load outside the lock; if several requests race, the last load wins
+    index = _load_contest_index(db, contest_id)
+    with index_lock:
+        _contest_indexes[contest_id] = index
+    return index, True
+
+
+def get_contest_rank_index(db, contest_id: ObjectId) -> RankIndex:
+    """Return the live ranking for one contest."""
+    return _synced_contest_index(db, contest_id)[0]
+
+
+def drop_contest_rank_index(contest_id: ObjectId):
+    with _contest_indexes_lock:
+        _contest_indexes.pop(contest_id, None)
+        _contest_locks.pop(contest_id, None)
+
+
+def _diff_contest_ranks(index: RankIndex, from_rank: int = 1) -> list:
+    """
+    The [(value, rank)] pairs from *from_rank* onwards whose stored rank is
+    out of date.  Marks them as stored; _write_contest_ranks makes that true.
+    Call with the contest's index lock held.
+    """
+    changed = []
+    for rank, _member, value in index.top(len(index), from_rank - 1):
+        if value['rank'] != rank:
+            changed.append((value, rank))
+            value['rank'] = rank
+    return changed
+
+
+def _write_contest_ranks(db, changed: list, write_lock: threading.Lock):
+    """bulk_write *changed* and release *write_lock* (acquired by the caller)."""
+    try:
+        for start in range(0, len(changed), CONTEST_RANK_BATCH_SIZE):
+            db.contestLeaderboard.bulk_write([
+                UpdateOne({'_id': value['_id']}, {'$set': {'rank': rank}})
+                for value, rank in changed[start:start + CONTEST_RANK_BATCH_SIZE]
+            ], ordered=False)
+    except Exception:
+        # Unknown stored rank — the next persist rewrites these entries
+        for value, _rank in changed:
+            value['rank'] = None
+        raise
+    finally:
+        write_lock.release()
+
+
+def _persist_contest_ranks(db, contest_id: ObjectId, index: RankIndex, from_rank: int = 1) -> list:
+    """Write the ranks from *from_rank* onwards that differ from what is stored.
+    Returns the [(value, rank)] pairs written."""
+    index_lock, write_lock = _locks_for_contest(contest_id)
+    with index_lock:
+        changed = _diff_contest_ranks(index, from_rank)
+        write_lock.acquire()
+    _write_contest_ranks(db, changed, write_lock)
+    return changed
+
+
+def _publish_contest_changes(contest_id: ObjectId, changed: list):
+    """Push the rank delta of one persist to the contest's SSE subscribers."""
+    if changed:
+        rank_events.publish(contest_id, 'ranks', {'changes': [
+            {
+                'studentId': value['studentId'],
+                'rank':      rank,
+                'score':     value['score'],
+                'timeTaken': value['timeTaken']
+            }
+            for value, rank in changed
+        ]})
+
+
+def update_contest_ranks(db, contest_id: ObjectId, entry: dict = None) -> RankIndex:
+    """
+    Update and persist ranks within a single contest's leaderboard.
+
+    With *entry* (a freshly submitted contestLeaderboard document) only that
+    entry is moved in the in-memory ranking, and only entries at or behind
+    its position are compared and written.  Without it, every rank is checked.
+    Returns the contest's RankIndex.
+    """
+    pending = entry['studentId'] if entry is not None else None
+    index, reloaded = _synced_contest_index(db, contest_id, pending)
+    if entry is None or reloaded:
+        changed = _persist_contest_ranks(db, contest_id, index)
+        invalidate_board(contest_id)
+        _publish_contest_changes(contest_id, changed)
+        return index
+
+    index_lock, write_lock = _locks_for_contest(contest_id)
+    changed = []
+    with index_lock:
+        previous_rank = index.rank_of(pending)
+        stored        = index.get(pending)
+        _index_contest_entry(index, {**entry, 'rank': stored['rank'] if stored else None})
+        new_rank = index.rank_of(pending)
+        if not rank_coalescing_enabled():
+            changed = _diff_contest_ranks(index, min(new_rank, previous_rank or new_rank))
+            write_lock.acquire()
+    if rank_coalescing_enabled():
+        mark_rank_dirty(db, contest_id)
+    else:
+        _write_contest_ranks(db, changed, write_lock)
+    invalidate_board(contest_id)
+    _publish_contest_changes(contest_id, changed)
+    return index
+
+
+def _contest_ranked_before(entry: dict) -> dict:
+    """Mongo filter for every contest entry that sorts strictly ahead of *entry*."""
+    score, taken = entry.get('score', 0), entry.get('timeTaken', 0)
+    return {'$or': [
+        {'score': {'$gt': score}},
+        {'score': score, 'timeTaken': {'$lt': taken}},
+        {'score': score, 'timeTaken': taken, '_id': {'$lt': entry['_id']}},
+    ]}
+
+
+def _contest_ranked_after(entry: dict) -> dict:
+    """Mongo filter for every contest entry that sorts strictly behind *entry*."""
+    score, taken = entry.get('score', 0), entry.get('timeTaken', 0)
+    return {'$or': [
+        {'score': {'$lt': score}},
+        {'score': score, 'timeTaken': {'$gt': taken}},
+        {'score': score, 'timeTaken': taken, '_id': {'$gt': entry['_id']}},
+    ]}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Paginated reads (keyset) + "around me"
+# ─────────────────────────────────────────────────────────────────────────────
+# Global pages are read from the in-process RankIndex (the cursor is the last
+# rank served); contest pages walk the (contestId, score DESC, timeTaken ASC,
+# _id ASC) index with the sort key of the last row served as cursor, and take
+# each row's rank from the contest's RankIndex.  Either way a page costs
+# O(limit) (+ O(log N)) however deep it is, and ranks never lag behind.
+LEADERBOARD_PAGE_SIZE     = int(os.getenv('LEADERBOARD_PAGE_SIZE', '50'))
+LEADERBOARD_MAX_PAGE_SIZE = int(os.getenv('LEADERBOARD_MAX_PAGE_SIZE', '200'))
+
+_CONTEST_ORDER = [('score', DESCENDING), ('timeTaken', ASCENDING), ('_id', ASCENDING)]
+_CONTEST_ORDER_REVERSED = [(field, -direction) for field, direction in _CONTEST_ORDER]
+
+
+def global_page(db, limit: int, after_rank: int = 0) -> list:
+    """Global entries with rank > *after_rank*, in rank order (from the RankIndex,
+    so ranks are exact even while stored ranks are being coalesced)."""
+    return global_top(db, limit, after_rank)
+
+
+def global_around(db, student_id: ObjectId, n: int):
+    """(entry, window) — the student's global entry and the ±n entries around it."""
+    index = get_global_rank_index(db)
+    rank  = index.rank_of(student_id)
+    if rank is None:
+        return None, []
+    start  = max(0, rank - n - 1)
+    window = [
+        {**value, 'rank': r}
+        for r, _member, value in index.top(rank + n - start, start)
+    ]
+    return {**index.get(student_id), 'rank': rank}, window
+
+
+def _with_contest_ranks(db, contest_id: ObjectId, rows: list) -> list:
+    """Give contest rows their live rank from the contest RankIndex, so pages
+    are exact even while stored ranks are being coalesced."""
+    index = get_contest_rank_index(db, contest_id)
+    return [{**row, 'rank': index.rank_of(row['studentId']) or row.get('rank')} for row in rows]
+
+
+def contest_page(db, contest_id: ObjectId, limit: int, after: dict = None) -> list:
+    """Submitted entries of one contest in ranking order, starting behind *after*
+    ({score, timeTaken, _id} of the last row of the previous page)."""
+    query = {'contestId': contest_id, 'isSubmitted': True}
+    if after is not None:
+        query.update(_contest_ranked_after(after))
+    return _with_contest_ranks(
+        db, contest_id, list(db.contestLeaderboard.find(query).sort(_CONTEST_ORDER).limit(limit))
+    )
+
+
+def contest_around(db, contest_id: ObjectId, student_id: ObjectId, n: int):
+    """(entry, window) — the student's contest entry and the ±n submitted entries around it."""
+    me = db.contestLeaderboard.find_one(
+        {'contestId': contest_id, 'studentId': student_id, 'isSubmitted': True}
+    )
+    if me is None:
+        return None, []
+    base   = {'contestId': contest_id, 'isSubmitted': True}
+    ahead  = db.contestLeaderboard.find({**base, **_contest_ranked_before(me)}) \
+                                  .sort(_CONTEST_ORDER_REVERSED).limit(n)
+    behind = list(db.contestLeaderboard.find({**base, **_contest_ranked_after(me)})
+                                       .sort(_CONTEST_ORDER).limit(n))
+    window = _with_contest_ranks(db, contest_id, list(ahead)[::-1] + [me] + behind)
+    return window[-len(behind) - 1], window
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Coalesced rank recompute
+# ─────────────────────────────────────────────────────────────────────────────
+# A board is GLOBAL_BOARD or a contest ObjectId.  Each change only marks its
+# board dirty; the stored ranks are rewritten (changed rows only, bulk_write)
+# once the board has been dirty for the interval or has collected
+# RANK_RECOMPUTE_MAX_CHANGES changes.  Reads served from the in-process
+# RankIndex stay exact in the meantime.  Interval 0 keeps per-change writes.
+RANK_RECOMPUTE_INTERVAL_SECONDS = float(os.getenv('RANK_RECOMPUTE_INTERVAL_SECONDS', '0'))
+RANK_RECOMPUTE_MAX_CHANGES      = int(os.getenv('RANK_RECOMPUTE_MAX_CHANGES', '500'))
+
+_dirty_boards = {}      # board → {'since': epoch seconds, 'changes': n}
+_rank_metrics = {}      # board → {'lastRecomputeAt', 'lastDurationMs', 'recomputes'}
+_dirty_lock   = threading.Lock()
+_flush_lock   = threading.Lock()
+
+
+def rank_coalescing_enabled() -> bool:
+    return RANK_RECOMPUTE_INTERVAL_SECONDS > 0
+
+
+def mark_rank_dirty(db, board):
+    """Record one change to *board*; flushes right away once the change budget is used up."""
+    with _dirty_lock:
+        state = _dirty_boards.setdefault(board, {'since': time.time(), 'changes': 0})
+        state['changes'] += 1
+        due = state['changes'] >= RANK_RECOMPUTE_MAX_CHANGES
+    if due:
+        flush_rank_board(db, board)
+
+
+def flush_rank_board(db, board) -> bool:
+    """Rewrite the stored ranks of one dirty board.  Returns False if it was clean."""
+    with _flush_lock:
+        with _dirty_lock:
+            state = _dirty_boards.pop(board, None)
+        if state is None:
+            return False
+
+        started = time.perf_counter()
+        try:
+            if board == GLOBAL_BOARD:
+                with board_lock(db, GLOBAL_BOARD, RANK_RECONCILE_LEASE_SECONDS):
+                    _recompute_global_ranks(db)
+                publish_global_snapshot(db)
+            else:
+                index   = get_contest_rank_index(db, board)
+                changed = _persist_contest_ranks(db, board, index)
+                invalidate_board(board)
+                _publish_contest_changes(board, changed)
+        except Exception:
+            # Put the changes back so the next flush retries them
+            with _dirty_lock:
+                merged = _dirty_boards.setdefault(board, {'since': state['since'], 'changes': 0})
+                merged['since']    = min(merged['since'], state['since'])
+                merged['changes'] += state['changes']
+            raise
+
+        metrics = _rank_metrics.setdefault(board, {'recomputes': 0})
+        metrics['lastRecomputeAt'] = time.time()
+        metrics['lastDurationMs']  = round((time.perf_counter() - started) * 1000, 2)
+        metrics['lastChanges']     = state['changes']
+        metrics['recomputes']     += 1
+        return True
+
+
+def flush_dirty_ranks(db) -> int:
+    """Flush every dirty board.  Scheduled job (every RANK_RECOMPUTE_INTERVAL_SECONDS)."""
+    with _dirty_lock:
+        boards = list(_dirty_boards)
+    return sum(1 for board in boards if flush_rank_board(db, board))
+
+
+def rank_recompute_metrics() -> dict:
+    """Staleness and recompute timings per board (contest boards keyed by id)."""
+    now    = time.time()
+    boards = {}
+    with _dirty_lock:
+        for board in set(_dirty_boards) | set(_rank_metrics):
+            state   = _dirty_boards.get(board)
+            metrics = _rank_metrics.get(board, {})
+            boards[str(board)] = {
+                'dirty':            state is not None,
+                'pendingChanges':   state['changes'] if state else 0,
+                'stalenessSeconds': round(now - state['since'], 3) if state else 0.0,
+                'lastRecomputeAt':  metrics.get('lastRecomputeAt'),
+                'lastDurationMs':   metrics.get('lastDurationMs'),
+                'lastChanges':      metrics.get('lastChanges'),
+                'recomputes':       metrics.get('recomputes', 0)
+            }
+    return {
+        'intervalSeconds': RANK_RECOMPUTE_INTERVAL_SECONDS,
+        'maxChanges':      RANK_RECOMPUTE_MAX_CHANGES,
+        'boards':          boards
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Contest finalization
+# ─────────────────────────────────────────────────────────────────────────────
+CONTEST_FINALIZE_INTERVAL_SECONDS = int(os.getenv('CONTEST_FINALIZE_INTERVAL_SECONDS', '30'))
+
+
+def contest_end_time(contest: dict):
+    """Parse a contest's endTime (datetime or ISO string, as sent by the admin
+    form) into a naive UTC datetime.  Returns None if the contest never ends."""
+    end = contest.get('endTime')
+    if not end:
+        return None
+    if isinstance(end, str):
+        try:
+            end = datetime.datetime.fromisoformat(end.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if end.tzinfo is not None:
+        end = end.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return end
+
+
+def contest_has_ended(contest: dict) -> bool:
+    if contest.get('isFinalized'):
+        return True
+    end = contest_end_time(contest)
+    return end is not None and end <= datetime.datetime.utcnow()
+
+
+def finalize_contest(db, contest_id: ObjectId) -> list:
+    """
+    Freeze a contest: persist final ranks, award BADGE_CONTEST_WINNER to the
+    leader(s) in one bulk update and mark the contest finalized.
+    Idempotent — safe to run again or concurrently.  Returns the winner ids.
+    """
+    index   = update_contest_ranks(db, contest_id)
+    with _dirty_lock:
+        _dirty_boards.pop(contest_id, None)     # final ranks were just written
+    leaders = index.top(1)
+    winners = []
+    if leaders:
+        best = leaders[0][2]
+        # Everyone tied with the leader on (score, timeTaken) shares the win
+        for _rank, member, value in index.top(len(index)):
+            if (value['score'], value['timeTaken']) != (best['score'], best['timeTaken']):
+                break
+            winners.append(member)
+        db.users.update_many(
+            {'_id': {'$in': winners}},
+            {'$addToSet': {'badges': BADGE_CONTEST_WINNER}}
         )
 
-    return entries  # sorted, with new ranks
+    db.contests.update_one(
+        {'_id': contest_id},
+        {'$set': {
+            'isFinalized': True,
+            'finalizedAt': datetime.datetime.utcnow(),
+            'winnerIds':   winners
+        }}
+    )
+    drop_contest_rank_index(contest_id)
+    return winners
+
+
+def finalize_due_contests(db) -> int:
+    """Finalize every contest whose endTime has passed.  Scheduled job."""
+    finalized = 0
+    for contest in db.contests.find(
+        {'isFinalized': {'$ne': True}, 'endTime': {'$nin': [None, '']}},
+        {'endTime': 1}
+    ):
+        if contest_has_ended(contest):
+            finalize_contest(db, contest['_id'])
+            finalized += 1
+    return finalized
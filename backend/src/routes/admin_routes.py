@@ -6,12 +6,20 @@ Covers: module/question/contest CRUD + instructor-specific student tracking.
 import datetime
 from flask import Blueprint, request
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 from src.db import get_db
 from src.auth import admin_required, get_current_user
 from src.services.pdf_service import extract_text_from_pdf
 from src.services.question_service import generate_mcqs_from_text
-from src.leaderboard_service import update_contest_ranks
+from src.services.contest_question_set import (
+    compile_question_set, drop_question_set, recompile_question_sets
+)
+from src.services.answer_key_cache import invalidate_answer_key
+from src.services.quantile_sketch import drop_contest_sketch
+from src.leaderboard_service import (
+    published_global_top, drop_contest_rank_index, finalize_contest, instructor_cohort
+)
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -179,17 +187,18 @@ def get_all_students_progress():
     db             = get_db()
     instructor_oid = ObjectId(caller['uid'])
 
-    filter_q = {'instructorId': instructor_oid} if caller.get('role') == 'admin' else {}
-    progress_list = list(db.userProgress.find(
-        filter_q,
-        {'passwordHash': 0}
-    ).sort([('xp', -1), ('level', -1)]))
+    # Served from the materialized instructorLeaderboard view
+    if caller.get('role') == 'admin':
+        progress_list = instructor_cohort(db, instructor_oid)
+    else:
+        progress_list = list(db.instructorLeaderboard.find({}).sort([('xp', -1), ('level', -1)]))
 
     result = []
     for p in progress_list:
         result.append({
             'studentId':            str(p['studentId']),
             'name':                 p.get('name', ''),
+            'cohortRank':           p.get('cohortRank'),
             'xp':                   p.get('xp', 0),
             'level':                p.get('level', 1),
             'completedModulesCount': p.get('completedModulesCount', 0),
@@ -209,7 +218,7 @@ def get_all_students_progress():
 @admin_required
 def admin_global_leaderboard():
     db = get_db()
-    entries = list(db.globalLeaderboard.find({}).sort('rank', 1).limit(100))
+    entries = published_global_top(db)
     result  = []
     for e in entries:
         result.append({
@@ -284,6 +293,7 @@ def update_module(module_id):
     )
     if result.matched_count == 0:
         return {'error': 'Module not found'}, 404
+    invalidate_answer_key(db, ObjectId(module_id))
     return {'status': 'updated', 'modifiedCount': result.modified_count}
 
 
@@ -295,6 +305,8 @@ def delete_module(module_id):
     if result.deleted_count == 0:
         return {'error': 'Module not found'}, 404
     db.questions.delete_many({'moduleId': ObjectId(module_id)})
+    invalidate_answer_key(db, ObjectId(module_id))
+    recompile_question_sets(db, module_id=ObjectId(module_id))
     return {'status': 'deleted'}
 
 
@@ -325,6 +337,8 @@ def create_question():
         'source':        'manual'
     }
     db.questions.insert_one(q)
+    invalidate_answer_key(db, q['moduleId'])
+    recompile_question_sets(db, module_id=q['moduleId'])
     return {'status': 'created'}
 
 
@@ -354,22 +368,34 @@ def update_question(question_id):
     if not update_data:
         return {'error': 'No fields to update'}, 400
 
-    result = db.questions.update_one(
+    before = db.questions.find_one_and_update(
         {'_id': ObjectId(question_id)},
-        {'$set': update_data}
+        {'$set': update_data},
+        projection={'moduleId': 1, 'contestId': 1, **{f: 1 for f in update_data}}
     )
-    if result.matched_count == 0:
+    if before is None:
         return {'error': 'Question not found'}, 404
-    return {'status': 'updated', 'modifiedCount': result.modified_count}
+    if before.get('moduleId'):
+        invalidate_answer_key(db, before['moduleId'])
+    modified = any(before.get(f) != v for f, v in update_data.items())
+    if modified:
+        recompile_question_sets(db, module_id=before.get('moduleId'), contest_id=before.get('contestId'))
+    return {'status': 'updated', 'modifiedCount': int(modified)}
 
 
 @admin_bp.delete('/question/delete/<question_id>')
 @admin_required
 def delete_question(question_id):
     db     = get_db()
-    result = db.questions.delete_one({'_id': ObjectId(question_id)})
-    if result.deleted_count == 0:
+    deleted = db.questions.find_one_and_delete(
+        {'_id': ObjectId(question_id)},
+        projection={'moduleId': 1, 'contestId': 1}
+    )
+    if deleted is None:
         return {'error': 'Question not found'}, 404
+    if deleted.get('moduleId'):
+        invalidate_answer_key(db, deleted['moduleId'])
+    recompile_question_sets(db, module_id=deleted.get('moduleId'), contest_id=deleted.get('contestId'))
     return {'status': 'deleted'}
 
 
@@ -457,6 +483,21 @@ def generate_module_from_pdf():
 # ─────────────────────────────────────────────────────────────────────────────
 #  Contest CRUD
 # ─────────────────────────────────────────────────────────────────────────────
+def _utc_timestamp(value):
+    """
+    Normalize a contest start/end time to an ISO-8601 UTC string ('…Z').
+    The admin form sends toISOString(); an offset-less value is taken as UTC,
+    which is also how contest_end_time reads it.  Raises ValueError if unparseable.
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat(timespec='seconds') + 'Z'
+
+
 @admin_bp.post('/contest/create')
 @admin_required
 def create_contest():
@@ -473,11 +514,17 @@ def create_contest():
     except Exception:
         return {'error': 'Invalid Module ID in list'}, 400
 
+    try:
+        start_time = _utc_timestamp(data.get('startTime'))
+        end_time   = _utc_timestamp(data.get('endTime'))
+    except (TypeError, ValueError):
+        return {'error': 'startTime/endTime must be ISO-8601 timestamps'}, 400
+
     contest = {
         'title':          title,
         'moduleIds':      module_ids,
-        'startTime':      data.get('startTime'),
-        'endTime':        data.get('endTime'),
+        'startTime':      start_time,
+        'endTime':        end_time,
         'durationMinutes': int(data.get('durationMinutes', 30)),
         'marksPerQuestion': int(data.get('marksPerQuestion', 1)),
         'negativeMarking': float(data.get('negativeMarking', 0)),
@@ -500,6 +547,9 @@ def create_contest():
             'source':        'custom_contest'
         })
 
+    # Freeze the question set + answer key now rather than on every request
+    compile_question_set(db, contest)
+
     return {'status': 'created', 'contestId': str(contest_id)}, 201
 
 
@@ -512,8 +562,11 @@ def update_contest(contest_id):
     update_data = {}
     if 'title'           in data: update_data['title']           = data['title']
     if 'moduleIds'       in data: update_data['moduleIds']       = [ObjectId(m) for m in data['moduleIds']]
-    if 'startTime'       in data: update_data['startTime']       = data['startTime']
-    if 'endTime'         in data: update_data['endTime']         = data['endTime']
+    try:
+        if 'startTime'   in data: update_data['startTime']       = _utc_timestamp(data['startTime'])
+        if 'endTime'     in data: update_data['endTime']         = _utc_timestamp(data['endTime'])
+    except (TypeError, ValueError):
+        return {'error': 'startTime/endTime must be ISO-8601 timestamps'}, 400
     if 'durationMinutes' in data: update_data['durationMinutes'] = int(data['durationMinutes'])
     if 'marksPerQuestion'in data: update_data['marksPerQuestion']= int(data['marksPerQuestion'])
     if 'negativeMarking' in data: update_data['negativeMarking'] = float(data['negativeMarking'])
@@ -523,13 +576,15 @@ def update_contest(contest_id):
     if not update_data:
         return {'error': 'No fields to update'}, 400
 
-    result = db.contests.update_one(
+    contest = db.contests.find_one_and_update(
         {'_id': ObjectId(contest_id)},
-        {'$set': update_data}
+        {'$set': update_data},
+        return_document=ReturnDocument.AFTER
     )
-    if result.matched_count == 0:
+    if contest is None:
         return {'error': 'Contest not found'}, 404
-    return {'status': 'updated', 'modifiedCount': result.modified_count}
+    question_set = compile_question_set(db, contest)
+    return {'status': 'updated', 'questionSetVersion': question_set['version']}
 
 
 @admin_bp.delete('/contest/delete/<contest_id>')
@@ -540,4 +595,19 @@ def delete_contest(contest_id):
     if result.deleted_count == 0:
         return {'error': 'Contest not found'}, 404
     db.contestLeaderboard.delete_many({'contestId': ObjectId(contest_id)})
+    drop_contest_rank_index(ObjectId(contest_id))
+    drop_question_set(db, ObjectId(contest_id))
+    drop_contest_sketch(db, ObjectId(contest_id))
     return {'status': 'deleted'}
+
+
+@admin_bp.post('/contest/finalize/<contest_id>')
+@admin_required
+def finalize_contest_now(contest_id):
+    """Freeze ranks and award winner badges now, without waiting for endTime."""
+    db      = get_db()
+    contest = db.contests.find_one({'_id': ObjectId(contest_id)}, {'_id': 1})
+    if not contest:
+        return {'error': 'Contest not found'}, 404
+    winners = finalize_contest(db, contest['_id'])
+    return {'status': 'finalized', 'winnerIds': [str(w) for w in winners]}
@@ -3,13 +3,25 @@ Contest Routes — /api/
 Accessible by all authenticated users (students can join & submit).
 Uses the renamed 'contestLeaderboard' collection.
 """
+import json
+import base64
 import datetime
-from flask import Blueprint, request
+from flask import Blueprint, Response, request, stream_with_context
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 from src.db import get_db
-from src.models import BADGE_CONTEST_WINNER
-from src.leaderboard_service import update_contest_ranks
+from src.services.contest_question_set import get_question_set
+from src.services.xp_buckets import period_board, PERIOD_WEEK, PERIOD_MONTH
+from src.services.quantile_sketch import record_contest_score, contest_percentile
+from src.leaderboard_service import (
+    update_contest_ranks, published_global_top, contest_has_ended, finalize_contest,
+    global_page, global_around, contest_page, contest_around,
+    GLOBAL_BOARD, LEADERBOARD_PAGE_SIZE, LEADERBOARD_MAX_PAGE_SIZE
+)
+from src.services.response_cache import cached_json
+from src.services import rank_events
 
 contest_bp = Blueprint('contest', __name__)
 
@@ -37,7 +49,8 @@ def list_contests():
             'durationMinutes': c.get('durationMinutes', 30),
             'marksPerQuestion': c.get('marksPerQuestion', 1),
             'negativeMarking': c.get('negativeMarking', 0),
-            'moduleIds':       [str(m) for m in c.get('moduleIds', [])]
+            'moduleIds':       [str(m) for m in c.get('moduleIds', [])],
+            'isFinalized':     c.get('isFinalized', False)
         })
     return {'contests': result}
 
@@ -52,17 +65,7 @@ def get_contest_questions(contest_id):
     if not contest:
         return {'error': 'Contest not found'}, 404
 
-    module_ids = contest.get('moduleIds', [])
-    query = {
-        '$or': [
-            {'moduleId':  {'$in': module_ids}},
-            {'contestId': ObjectId(contest_id)}
-        ]
-    }
-    questions = list(db.questions.find(query))
-    for q in questions:
-        q['_id']      = str(q['_id'])
-        q['moduleId'] = str(q.get('moduleId', ''))
+    questions = get_question_set(db, contest)['questions']
 
     return {
         'questions': questions,
@@ -135,25 +138,14 @@ def submit_contest(contest_id):
     if not contest:
         return {'error': 'Contest not found'}, 404
 
-    # Prevent double submission
-    existing = db.contestLeaderboard.find_one({
-        'contestId': contest_oid,
-        'studentId': student_oid,
-        'isSubmitted': True
-    })
-    if existing:
-        return {'error': 'Already submitted'}, 409
+    # Ranks are frozen once the contest ends
+    if contest_has_ended(contest):
+        if not contest.get('isFinalized'):
+            finalize_contest(db, contest_oid)
+        return {'error': 'Contest has ended'}, 403
 
-    # Grade answers
-    module_ids = contest.get('moduleIds', [])
-    query = {
-        '$or': [
-            {'moduleId':  {'$in': module_ids}},
-            {'contestId': contest_oid}
-        ]
-    }
-    questions    = list(db.questions.find(query))
-    question_map = {str(q['_id']): q for q in questions}
+    # Grade answers against the contest's frozen answer key
+    answer_key = get_question_set(db, contest)['answerKey']
 
     marks_per_q = contest.get('marksPerQuestion', 1)
     negative    = contest.get('negativeMarking', 0)
@@ -166,9 +158,8 @@ def submit_contest(contest_id):
     for ans in answers:
         q_id     = ans.get('questionId')
         selected = int(ans.get('selectedOption', -1))
-        q_obj    = question_map.get(q_id)
-        if q_obj:
-            is_correct = (selected == q_obj.get('correctAnswer'))
+        if q_id in answer_key:
+            is_correct = (selected == answer_key[q_id])
             if is_correct:
                 score         += marks_per_q
                 correct_count += 1
@@ -185,48 +176,40 @@ def submit_contest(contest_id):
 
     student = db.users.find_one({'_id': student_oid}, {'name': 1, 'instructorId': 1})
 
-    # Upsert submission
-    db.contestLeaderboard.update_one(
-        {'contestId': contest_oid, 'studentId': student_oid},
-        {'$set': {
-            'studentName':  student.get('name', '') if student else '',
-            'instructorId': student.get('instructorId') if student else None,
-            'score':        score,
-            'correctCount': correct_count,
-            'wrongCount':   wrong_count,
-            'timeTaken':    time_taken,
-            'answers':      processed,
-            'isSubmitted':  True,
-            'submittedAt':  datetime.datetime.utcnow()
-        }},
-        upsert=True
-    )
+    # Upsert submission — the isSubmitted guard plus the unique
+    # (contestId, studentId) index reject a second submission atomically
+    try:
+        entry = db.contestLeaderboard.find_one_and_update(
+            {'contestId': contest_oid, 'studentId': student_oid, 'isSubmitted': {'$ne': True}},
+            {'$set': {
+                'studentName':  student.get('name', '') if student else '',
+                'instructorId': student.get('instructorId') if student else None,
+                'score':        score,
+                'correctCount': correct_count,
+                'wrongCount':   wrong_count,
+                'timeTaken':    time_taken,
+                'answers':      processed,
+                'isSubmitted':  True,
+                'submittedAt':  datetime.datetime.utcnow()
+            }},
+            projection={'_id': 1, 'studentId': 1, 'score': 1, 'timeTaken': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return {'error': 'Already submitted'}, 409
 
-    # Recompute ranks
-    sorted_entries = update_contest_ranks(db, contest_oid)
-
-    # Award winner badge to #1
-    if sorted_entries:
-        top = sorted_entries[0]
-        top_entry = db.contestLeaderboard.find_one({'_id': top['_id']})
-        if top_entry:
-            db.users.update_one(
-                {'_id': top_entry['studentId']},
-                {'$addToSet': {'badges': BADGE_CONTEST_WINNER}}
-            )
-
-    # Fetch this student's current rank
-    my_entry = db.contestLeaderboard.find_one(
-        {'contestId': contest_oid, 'studentId': student_oid},
-        {'rank': 1}
-    )
+    # Move this entry in the live contest ranking; only changed ranks are written
+    ranking = update_contest_ranks(db, contest_oid, entry)
+    record_contest_score(db, contest_oid, score)
 
     return {
         'status':       'submitted',
         'score':        score,
         'correctCount': correct_count,
         'wrongCount':   wrong_count,
-        'rank':         my_entry.get('rank') if my_entry else None
+        'rank':         ranking.rank_of(student_oid),
+        'percentile':   contest_percentile(db, contest_oid, score)
     }
 
 
@@ -255,53 +238,132 @@ def get_contest_result(contest_id, student_id):
 
     # Enrich answers with correct options if submitted
     if entry.get('isSubmitted'):
-        review = result['answers']
-        q_ids  = [ObjectId(a['questionId']) for a in review if 'questionId' in a]
-        if q_ids:
-            q_data = list(db.questions.find({'_id': {'$in': q_ids}}, {'correctAnswer': 1}))
-            q_map  = {str(q['_id']): q.get('correctAnswer') for q in q_data}
-            for ans in review:
-                ans['correctOption'] = q_map.get(ans.get('questionId'))
+        result['percentile'] = contest_percentile(db, entry['contestId'], entry.get('score', 0))
+        contest = db.contests.find_one({'_id': ObjectId(contest_id)})
+        if contest:
+            answer_key = get_question_set(db, contest)['answerKey']
+            for ans in result['answers']:
+                ans['correctOption'] = answer_key.get(ans.get('questionId'))
 
     return result
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+#  Leaderboard paging helpers
+# ─────────────────────────────────────────────────────────────────────────────
+def _page_limit() -> int:
+    limit = request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int)
+    return max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
+
+
+def _encode_cursor(position: dict) -> str:
+    """Opaque keyset cursor: urlsafe base64 of the last row's sort key as JSON."""
+    raw = json.dumps(position, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> dict:
+    """Inverse of _encode_cursor; raises ValueError on anything malformed."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception as exc:
+        raise ValueError('malformed cursor') from exc
+
+
+def _window_size() -> int:
+    return max(0, min(request.args.get('n', 5, type=int), 50))
+
+
+def _name_map(db, entries: list, name_field: str) -> dict:
+    """Batch-load names for entries whose snapshot has none."""
+    missing = [e['studentId'] for e in entries if not e.get(name_field)]
+    if not missing:
+        return {}
+    users = db.users.find({'_id': {'$in': missing}}, {'name': 1})
+    return {u['_id']: u.get('name', 'Unknown Student') for u in users}
+
+
+def _serialize_contest_entries(db, entries: list) -> list:
+    names = _name_map(db, entries, 'studentName')
+    return [{
+        'rank':         e.get('rank'),
+        'studentId':    str(e['studentId']),
+        'studentName':  e.get('studentName') or names.get(e['studentId'], 'Unknown Student'),
+        'instructorId': str(e['instructorId']) if e.get('instructorId') else None,
+        'score':        e.get('score', 0),
+        'correctCount': e.get('correctCount', 0),
+        'wrongCount':   e.get('wrongCount', 0),
+        'timeTaken':    e.get('timeTaken', 0),
+        'isSubmitted':  e.get('isSubmitted', False)
+    } for e in entries]
+
+
+def _serialize_global_entries(db, entries: list) -> list:
+    names = _name_map(db, entries, 'studentName')
+    return [{
+        'rank':                  e.get('rank'),
+        'studentId':             str(e['studentId']),
+        'studentName':           e.get('studentName') or names.get(e['studentId'], 'Unknown Student'),
+        'xp':                    e.get('xp', 0),
+        'level':                 e.get('level', 1),
+        'completedModulesCount': e.get('completedModulesCount', 0)
+    } for e in entries]
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 #  Contest Leaderboard
 # ─────────────────────────────────────────────────────────────────────────────
 @contest_bp.get('/contests/leaderboard/<contest_id>')
 def contest_leaderboard(contest_id):
-    db  = get_db()
-    lb  = list(
-        db.contestLeaderboard.find({'contestId': ObjectId(contest_id)})
-          .sort([('rank', 1)])
-    )
-    result = []
-    # Collect all missing student IDs for batch query
-    missing_name_uids = [e['studentId'] for e in lb if not e.get('studentName')]
-    name_map = {}
-    if missing_name_uids:
-        users = list(db.users.find({'_id': {'$in': missing_name_uids}}, {'name': 1}))
-        name_map = {u['_id']: u.get('name', 'Unknown Student') for u in users}
-
-    for e in lb:
-        s_id = e['studentId']
-        s_name = e.get('studentName')
-        if not s_name:
-            s_name = name_map.get(s_id, 'Unknown Student')
+    """
+    Keyset-paginated submitted entries, best first.
+    Query params: ?limit= (default 50) &cursor= (nextCursor of the previous page)
+    """
+    db     = get_db()
+    limit  = _page_limit()
+    after  = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            # score may be fractional (negative marking), so keep it numeric as stored
+            position = _decode_cursor(cursor)
+            after    = {
+                'score':     float(position['score']),
+                'timeTaken': float(position['timeTaken']),
+                '_id':       ObjectId(position['_id'])
+            }
+        except Exception:
+            return {'error': 'Invalid cursor'}, 400
 
-        result.append({
-            'rank':         e.get('rank'),
-            'studentId':    str(s_id),
-            'studentName':  s_name,
-            'instructorId': str(e['instructorId']) if e.get('instructorId') else None,
-            'score':        e.get('score', 0),
-            'correctCount': e.get('correctCount', 0),
-            'wrongCount':   e.get('wrongCount', 0),
-            'timeTaken':    e.get('timeTaken', 0),
-            'isSubmitted':  e.get('isSubmitted', False)
-        })
-    return {'leaderboard': result}
+    contest_oid = ObjectId(contest_id)
+
+    def load():
+        lb = contest_page(db, contest_oid, limit, after)
+        next_cursor = None
+        if len(lb) == limit:
+            last = lb[-1]
+            next_cursor = _encode_cursor({
+                'score':     last.get('score', 0),
+                'timeTaken': last.get('timeTaken', 0),
+                '_id':       last['_id']
+            })
+        return {'leaderboard': _serialize_contest_entries(db, lb), 'nextCursor': next_cursor}
+
+    return cached_json(contest_oid, (limit, cursor), load)
+
+
+@contest_bp.get('/contests/leaderboard/<contest_id>/around')
+def contest_leaderboard_around(contest_id):
+    """The student's contest rank with ?n= (default 5) neighbours either side."""
+    db         = get_db()
+    student_id = request.args.get('studentId')
+    if not student_id:
+        return {'error': 'studentId is required'}, 400
+
+    me, window = contest_around(db, ObjectId(contest_id), ObjectId(student_id), _window_size())
+    if me is None:
+        return {'error': 'No submission found for this contest'}, 404
+    return {'rank': me.get('rank'), 'leaderboard': _serialize_contest_entries(db, window)}
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -309,28 +371,90 @@ def contest_leaderboard(contest_id):
 # ─────────────────────────────────────────────────────────────────────────────
 @contest_bp.get('/leaderboard/global')
 def global_leaderboard():
-    db      = get_db()
-    entries = list(db.globalLeaderboard.find({}).sort('rank', 1).limit(100))
-    result  = []
-    
-    missing_name_uids = [e['studentId'] for e in entries if not e.get('studentName')]
-    name_map = {}
-    if missing_name_uids:
-        users = list(db.users.find({'_id': {'$in': missing_name_uids}}, {'name': 1}))
-        name_map = {u['_id']: u.get('name', 'Unknown Student') for u in users}
-
-    for e in entries:
-        s_id = e['studentId']
-        s_name = e.get('studentName')
-        if not s_name:
-            s_name = name_map.get(s_id, 'Unknown Student')
+    db = get_db()
+    return cached_json(
+        GLOBAL_BOARD, 'top',
+        lambda: {'leaderboard': _serialize_global_entries(db, published_global_top(db))}
+    )
 
-        result.append({
-            'rank':                  e.get('rank'),
-            'studentId':             str(s_id),
-            'studentName':           s_name,
-            'xp':                    e.get('xp', 0),
-            'level':                 e.get('level', 1),
-            'completedModulesCount': e.get('completedModulesCount', 0)
-        })
-    return {'leaderboard': result}
+
+@contest_bp.get('/leaderboard/global/page')
+def global_leaderboard_page():
+    """Keyset-paginated global board.  ?limit= &cursor= (last rank served)"""
+    db     = get_db()
+    limit  = _page_limit()
+    cursor = request.args.get('cursor', '0')
+    if not cursor.isdigit():
+        return {'error': 'Invalid cursor'}, 400
+
+    entries     = global_page(db, limit, int(cursor))
+    next_cursor = str(entries[-1]['rank']) if len(entries) == limit else None
+    return {'leaderboard': _serialize_global_entries(db, entries), 'nextCursor': next_cursor}
+
+
+@contest_bp.get('/leaderboard/global/around')
+def global_leaderboard_around():
+    """The student's global rank with ?n= (default 5) neighbours either side."""
+    db         = get_db()
+    student_id = request.args.get('studentId')
+    if not student_id:
+        return {'error': 'studentId is required'}, 400
+
+    me, window = global_around(db, ObjectId(student_id), _window_size())
+    if me is None:
+        return {'error': 'Student is not on the leaderboard yet'}, 404
+    return {'rank': me.get('rank'), 'leaderboard': _serialize_global_entries(db, window)}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Live rank updates (Server-Sent Events)
+# ─────────────────────────────────────────────────────────────────────────────
+def _sse_response(board) -> Response:
+    if rank_events.at_capacity():
+        return Response(
+            rank_events.format_event('error', {'error': 'Too many live streams, retry later'}),
+            status=503, mimetype='text/event-stream', headers={'Retry-After': '30'}
+        )
+    return Response(
+        stream_with_context(rank_events.stream(board)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@contest_bp.get('/contests/leaderboard/<contest_id>/stream')
+def contest_leaderboard_stream(contest_id):
+    """`ranks` events: {changes: [{studentId, rank, score, timeTaken}]}"""
+    try:
+        contest_oid = ObjectId(contest_id)
+    except Exception:
+        return {'error': 'Invalid contest id'}, 400
+    return _sse_response(contest_oid)
+
+
+@contest_bp.get('/leaderboard/global/stream')
+def global_leaderboard_stream():
+    """`move` events: {studentId, studentName, xp, level, previousRank, rank};
+    entries between previousRank and rank shift by one place."""
+    return _sse_response(GLOBAL_BOARD)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Weekly / Monthly Leaderboards (XP earned within the period)
+# ─────────────────────────────────────────────────────────────────────────────
+def _period_leaderboard(period: str):
+    """?bucket= picks a past period ('2026-W41' / '2026-09'); default is the current one."""
+    board = period_board(get_db(), period, request.args.get('bucket'))
+    for e in board['entries']:
+        e['studentId'] = str(e['studentId'])
+    return {'period': board['period'], 'bucket': board['bucket'], 'leaderboard': board['entries']}
+
+
+@contest_bp.get('/leaderboard/weekly')
+def weekly_leaderboard():
+    return _period_leaderboard(PERIOD_WEEK)
+
+
+@contest_bp.get('/leaderboard/monthly')
+def monthly_leaderboard():
+    return _period_leaderboard(PERIOD_MONTH)
@@ -7,6 +7,8 @@ from bson import ObjectId
 
 from src.db import get_db
 from src.models import level_for_xp, xp_for_next_level
+from src.leaderboard_service import global_rank_of
+from src.services.quantile_sketch import xp_percentile
 
 gamification_bp = Blueprint('gamification', __name__)
 
@@ -48,6 +50,8 @@ def student_progress():
             'badges':                snapshot.get('badges', []),
             'completedModulesCount': snapshot.get('completedModulesCount', 0),
             'totalAttempts':         snapshot.get('totalAttempts', 0),
+            'globalRank':            global_rank_of(db, student_oid),
+            'percentile':            xp_percentile(db, snapshot.get('xp', 0)),
             'lastActiveAt':          snapshot.get('lastActiveAt', '').isoformat() + 'Z'
                                      if snapshot.get('lastActiveAt') else None
         }
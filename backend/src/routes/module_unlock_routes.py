@@ -12,135 +12,36 @@ New endpoints:
   POST /api/modules/<module_id>/open            — record first open; return unlock status
   POST /api/modules/<module_id>/video/progress  — update video watch progress
   GET  /api/modules/<module_id>/unlock-status   — helper to query current status
+  GET  /api/courses/<course_id>/unlock-status   — status of every module of a course
 
 The GET /api/modules/<module_id>/questions endpoint is MODIFIED in quiz_routes.py
-to enforce the lock (403 if not unlocked).
+to enforce the lock (403 if not unlocked).  Responses that report an unlocked
+module to its own student carry an `unlockGrant` — a signed, module-scoped
+token the client sends back on the questions fetch (X-Unlock-Grant header)
+so the gate can skip the moduleUnlocks read.
 """
 
-import datetime
 import logging
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app
 from bson import ObjectId
 
 from src.db import get_db
-from src.auth import get_current_user, student_required
+from src.auth import get_current_user, student_required, create_unlock_grant
+from src.services.unlock_service import (
+    DEFAULT_READ_SECONDS, get_or_create_unlock, persist_unlock_if_due, unlock_view,
+    reading_seconds_elapsed, serialize_unlock, record_heartbeat, refresh_cached_unlock
+)
 
 logger = logging.getLogger(__name__)
 
 module_unlock_bp = Blueprint('module_unlock', __name__)
 
-# Minimum seconds to read content before reading timer is satisfied
-DEFAULT_READ_SECONDS = 300   # 5 minutes
-
-
-# ─────────────────────────────────────────────────────────────────────────────
-#  Internal helpers
-# ─────────────────────────────────────────────────────────────────────────────
-
-def _get_or_create_unlock(db, student_oid: ObjectId, module_oid: ObjectId) -> dict:
-    """Fetch the unlock document; create it if it doesn't exist yet."""
-    doc = db.moduleUnlocks.find_one({
-        'studentId': student_oid,
-        'moduleId':  module_oid
-    })
-    if doc:
-        return doc
-
-    # Fetch module config
-    module = db.modules.find_one({'_id': module_oid}) or {}
-    requires_video   = module.get('requiresVideoCompletion', True)
-    requires_reading = module.get('requiresReadingTime', True)
-    min_read_secs    = int(module.get('minReadSeconds', DEFAULT_READ_SECONDS))
-    video_links      = module.get('videoLinks', [])
-
-    # Build initial videoProgress list (one entry per video)
-    video_progress = [
-        {
-            'videoIndex':   i,
-            'durationSec':  0,
-            'watchedSec':   0,
-            'completed':    False,
-            'lastUpdateAt': None
-        }
-        for i in range(len(video_links))
-    ]
-
-    now = datetime.datetime.utcnow()
-    doc = {
-        'studentId':          student_oid,
-        'moduleId':           module_oid,
-        'openedAt':           now,
-        'readSecondsRequired': min_read_secs,
-        'readTimerSatisfied': False,
-        'readingStartedAt':   now,    # timer anchored to first open
-        'videoRequired':      requires_video,
-        'videoProgress':      video_progress,
-        'videoSatisfied':     not requires_video or len(video_links) == 0,
-        'isUnlocked':         False,
-        'unlockedAt':         None,
-    }
-
-    # If no videos are required or module has no videos, video condition is already met
-    if not requires_video or len(video_links) == 0:
-        doc['videoSatisfied'] = True
-
-    # If reading is not required, reading condition is already met
-    if not requires_reading:
-        doc['readTimerSatisfied'] = True
-
-    db.moduleUnlocks.insert_one(doc)
-    doc = db.moduleUnlocks.find_one({'studentId': student_oid, 'moduleId': module_oid})
-    return doc
-
-
-def _check_and_set_unlocked(db, doc: dict) -> dict:
-    """
-    If both conditions are satisfied and the module is not yet unlocked,
-    set isUnlocked = True and record unlockedAt. Returns updated doc.
-    """
-    if doc.get('isUnlocked'):
-        return doc   # already unlocked — nothing to do
-
-    video_ok   = doc.get('videoSatisfied', False)
-    reading_ok = doc.get('readTimerSatisfied', False)
-
-    if video_ok and reading_ok:
-        now = datetime.datetime.utcnow()
-        db.moduleUnlocks.update_one(
-            {'_id': doc['_id']},
-            {'$set': {'isUnlocked': True, 'unlockedAt': now}}
-        )
-        doc = db.moduleUnlocks.find_one({'_id': doc['_id']})
-
-    return doc
-
-
-def _serialize_unlock(doc: dict) -> dict:
-    """Convert ObjectIds and datetimes to serialisable primitives."""
-    d = dict(doc)
-    d['_id']       = str(d['_id'])
-    d['studentId'] = str(d['studentId'])
-    d['moduleId']  = str(d['moduleId'])
-
-    for dt_field in ('openedAt', 'unlockedAt', 'readingStartedAt'):
-        if d.get(dt_field) and hasattr(d[dt_field], 'isoformat'):
-            d[dt_field] = d[dt_field].isoformat() + 'Z'
-
-    for vp in d.get('videoProgress', []):
-        if vp.get('lastUpdateAt') and hasattr(vp['lastUpdateAt'], 'isoformat'):
-            vp['lastUpdateAt'] = vp['lastUpdateAt'].isoformat() + 'Z'
-
-    return d
-
-
-def _reading_seconds_elapsed(doc: dict) -> int:
-    """How many seconds have elapsed since the module was first opened."""
-    started = doc.get('readingStartedAt') or doc.get('openedAt')
-    if not started:
-        return 0
-    now = datetime.datetime.utcnow()
-    return max(0, int((now - started).total_seconds()))
 
+def _with_grant(body: dict, user: dict, view: dict) -> dict:
+    """Attach an unlock grant when *view* is unlocked and belongs to the caller."""
+    if view.get('isUnlocked') and str(view['studentId']) == user.get('uid'):
+        body['unlockGrant'] = create_unlock_grant(current_app, view['studentId'], view['moduleId'])
+    return body
 
 # ─────────────────────────────────────────────────────────────────────────────
 #  POST /api/modules/<module_id>/open
@@ -163,28 +64,22 @@ def open_module(module_id):
         return {'error': 'Invalid ID format'}, 400
 
     db  = get_db()
-    doc = _get_or_create_unlock(db, student_oid, module_oid)
+    doc = get_or_create_unlock(db, student_oid, module_oid)
 
-    # Check if reading timer is now satisfied
-    if not doc.get('readTimerSatisfied') and doc.get('readSecondsRequired', DEFAULT_READ_SECONDS) > 0:
-        elapsed = _reading_seconds_elapsed(doc)
-        if elapsed >= doc.get('readSecondsRequired', DEFAULT_READ_SECONDS):
-            db.moduleUnlocks.update_one(
-                {'_id': doc['_id']},
-                {'$set': {'readTimerSatisfied': True}}
-            )
-            doc = db.moduleUnlocks.find_one({'_id': doc['_id']})
+    # Store isUnlocked once the reading timer (evaluated lazily) completes it
+    if not doc.get('isUnlocked'):
+        doc = persist_unlock_if_due(db, doc)
+        refresh_cached_unlock(doc)
 
-    doc = _check_and_set_unlocked(db, doc)
-
-    elapsed   = _reading_seconds_elapsed(doc)
+    view      = unlock_view(doc)
+    elapsed   = reading_seconds_elapsed(doc)
     remaining = max(0, doc.get('readSecondsRequired', DEFAULT_READ_SECONDS) - elapsed)
 
-    return {
-        'unlockStatus': _serialize_unlock(doc),
+    return _with_grant({
+        'unlockStatus': serialize_unlock(view),
         'readingElapsedSeconds': elapsed,
         'readingRemainingSeconds': remaining,
-    }, 200
+    }, user, view), 200
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -220,72 +115,19 @@ def update_video_progress(module_id):
     current_time   = float(payload.get('currentTimeSec', 0))
     event_type     = payload.get('eventType', 'timeupdate')
 
-    doc = _get_or_create_unlock(db, student_oid, module_oid)
-
-    # Guard: ignore calls if module already unlocked (no need to keep updating)
-    # but we still accept them (frontend may not check before sending)
-
-    video_progress = list(doc.get('videoProgress', []))
-
-    # Ensure entry exists for this video index
-    while len(video_progress) <= video_index:
-        video_progress.append({
-            'videoIndex':  len(video_progress),
-            'durationSec': 0,
-            'watchedSec':  0,
-            'completed':   False,
-            'lastUpdateAt': None
-        })
-
-    vp = video_progress[video_index]
-    now = datetime.datetime.utcnow()
-
-    # Update progress fields
-    if duration_sec > 0:
-        vp['durationSec'] = duration_sec
-    vp['watchedSec']   = max(vp.get('watchedSec', 0), current_time)
-    vp['lastUpdateAt'] = now
-
-    # Mark completed if ended OR watched ≥ 95%
-    already_completed = vp.get('completed', False)
-    if not already_completed:
-        watch_ratio = (current_time / duration_sec) if duration_sec > 0 else 0
-        if event_type == 'ended' or watch_ratio >= 0.95:
-            vp['completed'] = True
-
-    video_progress[video_index] = vp
-
-    # All videos must be completed for videoSatisfied = True
-    all_completed = all(v.get('completed', False) for v in video_progress)
-    video_satisfied = all_completed
-
-    db.moduleUnlocks.update_one(
-        {'_id': doc['_id']},
-        {'$set': {
-            'videoProgress':  video_progress,
-            'videoSatisfied': video_satisfied,
-        }}
+    # timeupdate heartbeats are buffered; see unlock_service for when they hit Mongo
+    doc, video_progress = record_heartbeat(
+        db, student_oid, module_oid, video_index, duration_sec, current_time, event_type
     )
-    doc = db.moduleUnlocks.find_one({'_id': doc['_id']})
-
-    # Also re-check reading timer
-    if not doc.get('readTimerSatisfied'):
-        elapsed = _reading_seconds_elapsed(doc)
-        if elapsed >= doc.get('readSecondsRequired', DEFAULT_READ_SECONDS):
-            db.moduleUnlocks.update_one(
-                {'_id': doc['_id']},
-                {'$set': {'readTimerSatisfied': True}}
-            )
-            doc = db.moduleUnlocks.find_one({'_id': doc['_id']})
-
-    doc = _check_and_set_unlocked(db, doc)
+    all_completed = all(v.get('completed', False) for v in video_progress)
+    view          = unlock_view({**doc, 'videoProgress': video_progress})
 
-    return {
-        'unlockStatus': _serialize_unlock(doc),
+    return _with_grant({
+        'unlockStatus': serialize_unlock(view),
         'videoIndex': video_index,
-        'videoCompleted': vp['completed'],
+        'videoCompleted': video_progress[video_index].get('completed', False),
         'allVideosCompleted': all_completed,
-    }, 200
+    }, user, view), 200
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -319,27 +161,106 @@ def get_unlock_status(module_id):
         return {'error': 'Invalid module_id'}, 400
 
     db  = get_db()
+    # Pure read — the reading timer and isUnlocked are derived, not written
     doc = db.moduleUnlocks.find_one({'studentId': student_oid, 'moduleId': module_oid})
     if not doc:
         return {'unlockStatus': None, 'isUnlocked': False}, 200
-
-    # Re-check reading timer on every status check
-    if not doc.get('readTimerSatisfied'):
-        elapsed = _reading_seconds_elapsed(doc)
-        if elapsed >= doc.get('readSecondsRequired', DEFAULT_READ_SECONDS):
-            db.moduleUnlocks.update_one(
-                {'_id': doc['_id']},
-                {'$set': {'readTimerSatisfied': True}}
-            )
-            doc = db.moduleUnlocks.find_one({'_id': doc['_id']})
-
-    doc = _check_and_set_unlocked(db, doc)
-    elapsed   = _reading_seconds_elapsed(doc)
+    doc = unlock_view(doc)
+    elapsed   = reading_seconds_elapsed(doc)
     remaining = max(0, doc.get('readSecondsRequired', DEFAULT_READ_SECONDS) - elapsed)
 
-    return {
-        'unlockStatus': _serialize_unlock(doc),
+    return _with_grant({
+        'unlockStatus': serialize_unlock(doc),
         'readingElapsedSeconds': elapsed,
         'readingRemainingSeconds': remaining,
         'isUnlocked': doc.get('isUnlocked', False),
+    }, user, doc), 200
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  GET /api/courses/<course_id>/unlock-status
+# ─────────────────────────────────────────────────────────────────────────────
+_COURSE_MODULE_PROJECTION = {
+    'moduleNo': 1, 'title': 1, 'videoLinks': 1,
+    'requiresVideoCompletion': 1, 'requiresReadingTime': 1, 'minReadSeconds': 1
+}
+
+
+def _module_status(module: dict, doc: dict) -> dict:
+    """Compact unlock status of one module; *doc* is None if never opened."""
+    if doc is None:
+        requires_reading = module.get('requiresReadingTime', True)
+        video_count      = len(module.get('videoLinks', []))
+        return {
+            'moduleId':                str(module['_id']),
+            'moduleNo':                module.get('moduleNo'),
+            'title':                   module.get('title', ''),
+            'opened':                  False,
+            'isUnlocked':              False,
+            'videoSatisfied':          not module.get('requiresVideoCompletion', True) or video_count == 0,
+            'videosCompleted':         0,
+            'videoCount':              video_count,
+            'readTimerSatisfied':      not requires_reading,
+            'readingRemainingSeconds': int(module.get('minReadSeconds', DEFAULT_READ_SECONDS)) if requires_reading else 0,
+        }
+
+    view           = unlock_view(doc)
+    video_progress = view.get('videoProgress', [])
+    remaining      = 0 if view['readTimerSatisfied'] else max(
+        0, view.get('readSecondsRequired', DEFAULT_READ_SECONDS) - reading_seconds_elapsed(view)
+    )
+    return {
+        'moduleId':                str(module['_id']),
+        'moduleNo':                module.get('moduleNo'),
+        'title':                   module.get('title', ''),
+        'opened':                  True,
+        'isUnlocked':              view.get('isUnlocked', False),
+        'videoSatisfied':          view.get('videoSatisfied', False),
+        'videosCompleted':         sum(1 for vp in video_progress if vp.get('completed')),
+        'videoCount':              len(video_progress),
+        'readTimerSatisfied':      view['readTimerSatisfied'],
+        'readingRemainingSeconds': remaining,
+    }
+
+
+@module_unlock_bp.get('/courses/<course_id>/unlock-status')
+@student_required
+def get_course_unlock_status(course_id):
+    """
+    Unlock status of every module of a course for the calling student
+    (or ?studentId=<id> for admins) — one modules query + one moduleUnlocks query.
+    Pure read, like /modules/<module_id>/unlock-status.
+    """
+    user = get_current_user()
+    if not user:
+        return {'error': 'Authentication required'}, 401
+
+    student_id_str = request.args.get('studentId')
+    if student_id_str and user.get('role') in ('super_admin', 'admin'):
+        try:
+            student_oid = ObjectId(student_id_str)
+        except Exception:
+            return {'error': 'Invalid studentId'}, 400
+    else:
+        student_oid = ObjectId(user['uid'])
+
+    try:
+        course_oid = ObjectId(course_id)
+    except Exception:
+        return {'error': 'Invalid course_id'}, 400
+
+    db      = get_db()
+    modules = list(db.modules.find({'courseId': course_oid}, _COURSE_MODULE_PROJECTION)
+                             .sort('moduleNo', 1))
+    docs    = {
+        doc['moduleId']: doc
+        for doc in db.moduleUnlocks.find({
+            'studentId': student_oid,
+            'moduleId':  {'$in': [m['_id'] for m in modules]}
+        })
+    } if modules else {}
+
+    return {
+        'courseId': course_id,
+        'modules':  [_module_status(m, docs.get(m['_id'])) for m in modules],
     }, 200
@@ -11,13 +11,17 @@ import datetime
 import logging
 from flask import Blueprint, request
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from src.db import get_db
 from src.auth import (
     hash_password, create_token, get_current_user,
     super_admin_required, ROLE_ADMIN, ROLE_STUDENT
 )
-from src.leaderboard_service import rebuild_global_leaderboard
+from src.leaderboard_service import (
+    rebuild_global_leaderboard, rank_recompute_metrics, move_student_cohort,
+    REBUILD_MODE_AGGREGATE, REBUILD_MODE_ITERATIVE
+)
 from src.services.email_service import send_email
 
 logger = logging.getLogger(__name__)
@@ -174,6 +178,7 @@ def assign_student():
     assigned_count = 0
     skipped_count  = 0
     email_failures = []
+    cohort_failures = []
 
     for student_oid in student_oids:
         student = found_map[student_oid]
@@ -201,6 +206,17 @@ def assign_student():
                 {'$set': {'instructorId': instructor_oid}},
                 upsert=False
             )
+            # Move the student into the instructor's cohort leaderboard.  The
+            # assignment itself has succeeded, so a failure here is reported
+            # instead of being counted as "already assigned".
+            try:
+                move_student_cohort(db, student_oid, instructor_oid)
+            except Exception:
+                logger.exception(
+                    "Cohort move failed for assignment: student=%s instructor=%s",
+                    str(student_oid), str(instructor_oid)
+                )
+                cohort_failures.append(str(student_oid))
             assigned_count += 1
 
             # ── Send email notifications (only after successful DB write) ──────
@@ -259,8 +275,8 @@ def assign_student():
                     str(student_oid), str(instructor_oid)
                 )
 
-        except Exception:
-            # Duplicate key error — already assigned
+        except DuplicateKeyError:
+            # Already assigned
             skipped_count += 1
 
     response = {
@@ -268,6 +284,9 @@ def assign_student():
         'assigned': assigned_count,
         'alreadyAssigned': skipped_count,
     }
+    if cohort_failures:
+        # Assigned, but not yet placed on the instructor's cohort board
+        response['cohortFailures'] = cohort_failures
 
     if email_failures:
         response['emailStatus'] = 'partial_failure'
@@ -318,6 +337,7 @@ def unassign_student():
         {'studentId': student_oid, 'instructorId': instructor_oid},
         {'$set': {'instructorId': None}}
     )
+    move_student_cohort(db, student_oid, None, expected_instructor=instructor_oid)
 
     return {'status': 'unassigned'}
 
@@ -350,6 +370,17 @@ def system_stats():
 @superadmin_bp.post('/rebuild-leaderboard')
 @super_admin_required
 def trigger_rebuild_leaderboard():
-    db = get_db()
-    rebuild_global_leaderboard(db)
-    return {'status': 'rebuilt'}
+    """Query param: ?mode=aggregate (default) | iterative (pre-5.0 MongoDB)"""
+    db   = get_db()
+    mode = request.args.get('mode', REBUILD_MODE_AGGREGATE)
+    if mode not in (REBUILD_MODE_AGGREGATE, REBUILD_MODE_ITERATIVE):
+        return {'error': f'Invalid mode: {mode}'}, 400
+    rebuild_global_leaderboard(db, mode)
+    return {'status': 'rebuilt', 'mode': mode}
+
+
+@superadmin_bp.get('/leaderboard-metrics')
+@super_admin_required
+def leaderboard_metrics():
+    """Rank staleness / recompute duration per board (this worker process only)."""
+    return rank_recompute_metrics()
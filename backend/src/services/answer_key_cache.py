@@ -0,0 +1,54 @@
+"""
+answer_key_cache.py
+Per-process LRU cache of compact quiz answer keys: moduleId → {questionId: correctAnswer}.
+
+Quiz grading reads from here instead of re-reading the module's questions on
+every submission.  The question/module CRUD endpoints in admin_routes call
+invalidate_answer_key after their write, which bumps the module's
+`answerKeyVersion`; a cache hit is only served while it matches the version
+on the module document (one _id point read), so an edit handled by any worker
+process is picked up by the next submission everywhere.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+ANSWER_KEY_CACHE_SIZE = int(os.getenv('ANSWER_KEY_CACHE_SIZE', '256'))
+
+_cache = OrderedDict()     # moduleId → (answerKeyVersion, answerKey)
+_lock  = threading.Lock()
+
+
+def _current_version(db, module_oid) -> int:
+    module = db.modules.find_one({'_id': module_oid}, {'answerKeyVersion': 1})
+    return (module or {}).get('answerKeyVersion', 0)
+
+
+def get_answer_key(db, module_oid) -> dict:
+    """Return {questionId (str): correctAnswer} for a module."""
+    version = _current_version(db, module_oid)
+    with _lock:
+        hit = _cache.get(module_oid)
+        if hit is not None and hit[0] == version:
+            _cache.move_to_end(module_oid)
+            return hit[1]
+
+    # Covered by the (moduleId, _id, correctAnswer) index
+    answer_key = {
+        str(q['_id']): q['correctAnswer']
+        for q in db.questions.find({'moduleId': module_oid}, {'_id': 1, 'correctAnswer': 1})
+    }
+
+    with _lock:
+        _cache[module_oid] = (version, answer_key)
+        _cache.move_to_end(module_oid)
+        while len(_cache) > ANSWER_KEY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return answer_key
+
+
+def invalidate_answer_key(db, module_oid):
+    """Mark a module's answer key as changed, in every worker.  Call after the write."""
+    db.modules.update_one({'_id': module_oid}, {'$inc': {'answerKeyVersion': 1}})
+    with _lock:
+        _cache.pop(module_oid, None)
@@ -0,0 +1,72 @@
+"""
+board_lock.py
+Mutual exclusion for writers of one ranked board, across threads and worker
+processes.
+
+Incremental rank moves (leaderboard_service._shift_ranks) are only correct
+when applied one at a time: a move counts the entries it passes, so two
+concurrent moves would count each other.  board_lock serializes them with
+  • a threading.Lock per board inside the process, and
+  • a lease on the board's `leaderboardLocks` document across processes.
+The lease expires after BOARD_LOCK_LEASE_SECONDS, so a crashed holder can't
+block a board forever; the periodic rank reconcile repairs anything a lapsed
+lease let through.
+"""
+import os
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+BOARD_LOCK_LEASE_SECONDS = float(os.getenv('BOARD_LOCK_LEASE_SECONDS', '10'))
+BOARD_LOCK_WAIT_SECONDS  = float(os.getenv('BOARD_LOCK_WAIT_SECONDS', '30'))
+
+_local_locks = {}      # board → threading.Lock
+_locks_lock  = threading.Lock()
+
+
+class BoardLockTimeout(RuntimeError):
+    """The board stayed locked by someone else for BOARD_LOCK_WAIT_SECONDS."""
+
+
+def _local_lock(board) -> threading.Lock:
+    with _locks_lock:
+        return _local_locks.setdefault(board, threading.Lock())
+
+
+def _acquire_lease(db, board, holder: ObjectId, lease: float):
+    deadline = time.monotonic() + BOARD_LOCK_WAIT_SECONDS
+    delay    = 0.005
+    while True:
+        now = datetime.datetime.utcnow()
+        try:
+            # Matches a free or expired lock; otherwise the upsert collides on _id
+            db.leaderboardLocks.update_one(
+                {'_id': board, '$or': [{'heldUntil': None}, {'heldUntil': {'$lt': now}}]},
+                {'$set': {'holder': holder, 'heldUntil': now + datetime.timedelta(seconds=lease)}},
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            pass
+        if time.monotonic() >= deadline:
+            raise BoardLockTimeout(f'board {board!r} is locked')
+        time.sleep(delay)
+        delay = min(delay * 2, 0.2)
+
+
+@contextmanager
+def board_lock(db, board, lease: float = None):
+    """Hold the write lock of *board* (a string) for the duration of the block."""
+    with _local_lock(board):
+        holder = ObjectId()
+        _acquire_lease(db, board, holder, lease or BOARD_LOCK_LEASE_SECONDS)
+        try:
+            yield
+        finally:
+            db.leaderboardLocks.update_one(
+                {'_id': board, 'holder': holder},
+                {'$set': {'heldUntil': None}}
+            )
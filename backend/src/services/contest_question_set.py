@@ -0,0 +1,130 @@
+"""
+contest_question_set.py
+Frozen, precompiled question set + answer key per contest.
+
+A contest's questions (its modules' questions plus its custom questions) are
+compiled once — when the contest is created, updated, or first started, and
+again whenever one of its questions is created, edited or deleted
+(recompile_question_sets) — into a versioned snapshot document in
+`contestQuestionSets`.  The contest
+document records the current `questionSetVersion`, so the per-process cache
+can be validated against the contest doc the routes already fetch: serving
+questions and grading a submission need no `questions` query at all.
+"""
+import datetime
+import threading
+from pymongo.errors import DuplicateKeyError
+
+
+_cache      = {}                  # contestId → snapshot
+_cache_lock = threading.Lock()
+
+
+def compile_question_set(db, contest: dict, fresh: bool = False) -> dict:
+    """
+    Build, store and publish a new snapshot version for *contest*.
+    On a version collision the concurrently stored snapshot is served, unless
+    *fresh* — then this build (which may include a question edit the other
+    one missed) is stored as the next version instead.
+    """
+    contest_id = contest['_id']
+    query = {
+        '$or': [
+            {'moduleId':  {'$in': contest.get('moduleIds', [])}},
+            {'contestId': contest_id}
+        ]
+    }
+    questions  = []
+    answer_key = {}
+    for q in sorted(db.questions.find(query), key=lambda q: q['_id']):
+        q_id = str(q['_id'])
+        questions.append({
+            '_id':           q_id,
+            'moduleId':      str(q.get('moduleId', '')),
+            'question':      q['question'],
+            'options':       q['options'],
+            'correctAnswer': q.get('correctAnswer'),
+            'difficulty':    q.get('difficulty')
+        })
+        answer_key[q_id] = q.get('correctAnswer')
+
+    while True:
+        latest  = db.contestQuestionSets.find_one(
+            {'contestId': contest_id}, {'version': 1}, sort=[('version', -1)]
+        )
+        version = (latest['version'] if latest else 0) + 1
+
+        snapshot = {
+            'contestId':  contest_id,
+            'version':    version,
+            'questions':  questions,
+            'answerKey':  answer_key,
+            'compiledAt': datetime.datetime.utcnow()
+        }
+        try:
+            db.contestQuestionSets.insert_one(snapshot)
+            break
+        except DuplicateKeyError:
+            if fresh:
+                continue
+            # Compiled concurrently (e.g. many students opening a legacy contest
+            # at once) — every racer built the same version, so serve the winner's
+            snapshot = db.contestQuestionSets.find_one({'contestId': contest_id, 'version': version})
+            break
+
+    # Publish: newer versions only ever move the pointer forward
+    db.contests.update_one(
+        {'_id': contest_id, 'questionSetVersion': {'$not': {'$gte': version}}},
+        {'$set': {'questionSetVersion': version}}
+    )
+    # Keep the previous version for workers still holding the old pointer
+    db.contestQuestionSets.delete_many({'contestId': contest_id, 'version': {'$lt': version - 1}})
+
+    with _cache_lock:
+        _cache[contest_id] = snapshot
+    return snapshot
+
+
+def get_question_set(db, contest: dict) -> dict:
+    """Return the frozen snapshot matching contest['questionSetVersion'],
+    compiling one on first start if the contest has none yet."""
+    contest_id = contest['_id']
+    version    = contest.get('questionSetVersion')
+    if version is None:
+        return compile_question_set(db, contest)
+
+    cached = _cache.get(contest_id)
+    if cached is not None and cached['version'] == version:
+        return cached
+
+    snapshot = db.contestQuestionSets.find_one({'contestId': contest_id, 'version': version})
+    if snapshot is None:
+        return compile_question_set(db, contest)
+
+    with _cache_lock:
+        _cache[contest_id] = snapshot
+    return snapshot
+
+
+def recompile_question_sets(db, module_id=None, contest_id=None) -> int:
+    """
+    Recompile every unfinalized contest that uses *module_id*'s questions (or
+    the contest *contest_id* a custom question belongs to), so question edits
+    reach contest grading.  Returns the number of contests recompiled.
+    """
+    if module_id is not None:
+        query = {'moduleIds': module_id}
+    elif contest_id is not None:
+        query = {'_id': contest_id}
+    else:
+        return 0
+    contests = list(db.contests.find({**query, 'isFinalized': {'$ne': True}}))
+    for contest in contests:
+        compile_question_set(db, contest, fresh=True)
+    return len(contests)
+
+
+def drop_question_set(db, contest_id):
+    db.contestQuestionSets.delete_many({'contestId': contest_id})
+    with _cache_lock:
+        _cache.pop(contest_id, None)
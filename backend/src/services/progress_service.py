@@ -0,0 +1,266 @@
+"""
+progress_service.py
+Per-student progress aggregates maintained on the users document.
+
+bestByModule — { "<moduleId>": best score ratio } updated with $max on every
+quiz attempt, so Module Master evaluation is O(modules) regardless of how
+many attempts a student has made.
+
+totalAttempts — incremented with every attempt; seeded from quizAttempts the
+first time a legacy student submits (backfill_attempt_counter), and
+reconcile_attempt_counters periodically repairs any drift.
+
+Quiz submission applies XP, level, badges, completedModules and bestByModule
+in ONE find_one_and_update with an update pipeline (submission_pipeline), so
+concurrent submits by the same student can't lose XP.  apply_submission is
+the same rule set in Python, evaluated on the pre-image that call returns to
+build the response.
+"""
+import os
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from src.models import (
+    XP_THRESHOLDS, level_for_xp,
+    BADGE_PERFECT, BADGE_QUICK, BADGE_MODULE_MASTER,
+    BADGE_FIRST_STEP, BADGE_SPEED_DEMON
+)
+
+MODULE_MASTER_RATIO = 0.8
+PASS_RATIO          = 0.7
+XP_PER_CORRECT      = 5      # first completion only
+
+
+def best_by_module_pipeline(match: dict = None) -> list:
+    """quizAttempts → one row per student with their best ratio per module."""
+    return [
+        {'$match': match or {}},
+        {'$group': {
+            '_id': {'studentId': '$studentId', 'moduleId': '$moduleId'},
+            'best': {'$max': {'$cond': [
+                {'$gt': ['$total', 0]},
+                {'$divide': ['$score', '$total']},
+                0
+            ]}}
+        }},
+        {'$group': {
+            '_id': '$_id.studentId',
+            'modules': {'$push': {'k': {'$toString': '$_id.moduleId'}, 'v': '$best'}}
+        }},
+    ]
+
+
+def backfill_best_by_module(db, student_oid=None) -> dict:
+    """
+    Build bestByModule from historical quizAttempts and $max it into users.
+    With *student_oid* only that student is backfilled and their map returned;
+    without it every student is (used by migrate_best_by_module.py).
+    """
+    match   = {'studentId': student_oid} if student_oid is not None else {}
+    ops     = []
+    student_best = {}
+    for row in db.quizAttempts.aggregate(best_by_module_pipeline(match), allowDiskUse=True):
+        best = {m['k']: m['v'] for m in row['modules']}
+        ops.append(UpdateOne(
+            {'_id': row['_id']},
+            {'$max': {f'bestByModule.{k}': v for k, v in best.items()}}
+        ))
+        if row['_id'] == student_oid:
+            student_best = best
+        if len(ops) >= 1000:
+            db.users.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.users.bulk_write(ops, ordered=False)
+
+    # Students without attempts still get the field, marking them as backfilled
+    users_filter = {'_id': student_oid} if student_oid is not None else {'role': 'student'}
+    db.users.update_many(
+        {**users_filter, 'bestByModule': {'$exists': False}},
+        {'$set': {'bestByModule': {}}}
+    )
+    return student_best
+
+
+def is_module_master(best_by_module: dict) -> bool:
+    return len(best_by_module) >= 1 and all(
+        r >= MODULE_MASTER_RATIO for r in best_by_module.values()
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Attempt counter reconciliation
+# ─────────────────────────────────────────────────────────────────────────────
+ATTEMPT_RECONCILE_INTERVAL_SECONDS = int(os.getenv('ATTEMPT_RECONCILE_INTERVAL_SECONDS', '3600'))
+
+
+def _attempt_drift_pipeline() -> list:
+    """Students whose totalAttempts differs from their quizAttempts count."""
+    return [
+        {'$match': {'role': 'student'}},
+        {'$lookup': {
+            'from':         'quizAttempts',
+            'localField':   '_id',
+            'foreignField': 'studentId',
+            'pipeline':     [{'$count': 'n'}],
+            'as':           'attemptStats'
+        }},
+        {'$project': {
+            'totalAttempts': 1,
+            'actual':        {'$ifNull': [{'$first': '$attemptStats.n'}, 0]}
+        }},
+        {'$match': {'$expr': {'$ne': [{'$ifNull': ['$totalAttempts', -1]}, '$actual']}}},
+    ]
+
+
+def backfill_attempt_counter(db, student_oid: ObjectId):
+    """Seed a legacy student's totalAttempts from their quizAttempts count."""
+    db.users.update_one(
+        {'_id': student_oid, 'totalAttempts': {'$exists': False}},
+        {'$set': {'totalAttempts': db.quizAttempts.count_documents({'studentId': student_oid})}}
+    )
+
+
+def reconcile_attempt_counters(db) -> int:
+    """Repair users/userProgress.totalAttempts drift.  Scheduled job; returns repairs."""
+    user_ops     = []
+    progress_ops = []
+    for row in db.users.aggregate(_attempt_drift_pipeline(), allowDiskUse=True):
+        user_ops.append(UpdateOne(
+            {'_id': row['_id']}, {'$set': {'totalAttempts': row['actual']}}
+        ))
+        progress_ops.append(UpdateOne(
+            {'studentId': row['_id']}, {'$set': {'totalAttempts': row['actual']}}
+        ))
+
+    if user_ops:
+        db.users.bulk_write(user_ops, ordered=False)
+        db.userProgress.bulk_write(progress_ops, ordered=False)
+    return len(user_ops)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Quiz submission rules
+# ─────────────────────────────────────────────────────────────────────────────
+def attempt_badges(score: int, total: int, time_taken: int) -> list:
+    """Badges earned by the attempt alone, independent of student history."""
+    badges = []
+    if total > 0 and score == total:
+        badges.append(BADGE_PERFECT)
+    if time_taken > 0 and total > 0 and (time_taken / total) <= 10:
+        badges.append(BADGE_QUICK)
+    if time_taken > 0 and time_taken <= 60:
+        badges.append(BADGE_SPEED_DEMON)
+    return badges
+
+
+def submission_pipeline(module_oid: ObjectId, score: int, total: int, time_taken: int) -> list:
+    """Update pipeline applying one quiz attempt to a users document."""
+    module_key = str(module_oid)
+    ratio      = score / max(total, 1)
+    passed     = ratio >= PASS_RATIO
+    completed  = {'$ifNull': ['$completedModules', []]}
+
+    return [
+        {'$set': {
+            '_firstCompletion': {'$and': [
+                passed,
+                {'$not': [{'$or': [
+                    {'$in': [module_oid, completed]},
+                    {'$in': [module_key, completed]}    # legacy string ids
+                ]}]}
+            ]},
+            '_priorCompletedCount': {'$size': completed},
+            'bestByModule': {'$mergeObjects': [
+                {'$ifNull': ['$bestByModule', {}]},
+                {module_key: {'$max': [{'$ifNull': [f'$bestByModule.{module_key}', 0]}, ratio]}}
+            ]},
+        }},
+        {'$set': {
+            'totalAttempts': {'$add': [{'$ifNull': ['$totalAttempts', 0]}, 1]},
+            'xp': {'$add': [
+                {'$ifNull': ['$xp', 0]},
+                {'$cond': ['$_firstCompletion', score * XP_PER_CORRECT, 0]}
+            ]},
+            'completedModules': {'$map': {
+                'input': {'$cond': [
+                    '$_firstCompletion',
+                    {'$concatArrays': [completed, [module_oid]]},
+                    completed
+                ]},
+                'in': {'$toObjectId': '$$this'}
+            }},
+            'badges': {'$setUnion': [
+                {'$ifNull': ['$badges', []]},
+                attempt_badges(score, total, time_taken),
+                {'$cond': [
+                    {'$and': ['$_firstCompletion', {'$eq': ['$_priorCompletedCount', 0]}]},
+                    [BADGE_FIRST_STEP], []
+                ]},
+                {'$cond': [
+                    {'$allElementsTrue': [{'$map': {
+                        'input': {'$objectToArray': '$bestByModule'},
+                        'in':    {'$gte': ['$$this.v', MODULE_MASTER_RATIO]}
+                    }}]},
+                    [BADGE_MODULE_MASTER], []
+                ]},
+            ]},
+        }},
+        {'$set': {
+            'level': {'$switch': {
+                'branches': [
+                    {'case': {'$gte': ['$xp', threshold]}, 'then': level}
+                    for level, threshold in reversed(list(enumerate(XP_THRESHOLDS, start=1)))
+                ],
+                'default': 1
+            }}
+        }},
+        {'$unset': ['_firstCompletion', '_priorCompletedCount']},
+    ]
+
+
+def apply_submission(user: dict, module_oid: ObjectId, score: int, total: int,
+                     time_taken: int) -> dict:
+    """
+    Python mirror of submission_pipeline.  Given the pre-update users document,
+    returns the outcome plus the resulting document ('user').
+    """
+    module_key = str(module_oid)
+    ratio      = score / max(total, 1)
+    completed  = [str(m) for m in user.get('completedModules', [])]
+    passed     = ratio >= PASS_RATIO
+    first      = passed and module_key not in completed
+
+    best = dict(user.get('bestByModule', {}))
+    best[module_key] = max(best.get(module_key, 0), ratio)
+
+    xp_earned = score * XP_PER_CORRECT if first else 0
+    new_xp    = int(user.get('xp', 0)) + xp_earned
+
+    old_badges = set(user.get('badges', []))
+    badges     = old_badges | set(attempt_badges(score, total, time_taken))
+    if first and len(completed) == 0:
+        badges.add(BADGE_FIRST_STEP)
+    if is_module_master(best):
+        badges.add(BADGE_MODULE_MASTER)
+
+    if first:
+        completed.append(module_key)
+
+    return {
+        'user': {
+            **user,
+            'totalAttempts':    int(user.get('totalAttempts', 0)) + 1,
+            'xp':               new_xp,
+            'level':            level_for_xp(new_xp),
+            'badges':           list(badges),
+            'completedModules': [ObjectId(m) for m in completed],
+            'bestByModule':     best
+        },
+        'xpEarned':          xp_earned,
+        'isFirstCompletion': first,
+        'moduleCompleted':   passed,
+        'previousLevel':     user.get('level', 1),
+        'newLevel':          level_for_xp(new_xp),
+        'badgesEarned':      list(badges - old_badges)
+    }
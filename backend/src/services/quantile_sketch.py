@@ -0,0 +1,245 @@
+"""
+quantile_sketch.py
+Approximate percentiles ("you are ahead of X% of students") for student XP
+and per-contest scores, without ranking anyone.
+
+The sketch is a relative-error log-bucket histogram (DDSketch-style): a value
+v ≥ 1 lands in bucket ceil(log_γ v), values < 1 in bucket -1.  Bucket counts
+simply add, so sketches from different worker processes merge with $inc, and
+a student's old XP can be taken out again when it changes.  With the default
+1% accuracy all XP values up to a million fit in ~700 buckets, so a
+percentile lookup costs the same however many students there are.
+
+Each process keeps
+  • a merged view — the persisted sketch plus its own changes since, and
+  • a delta — its changes not yet persisted,
+and the persist_sketches scheduler job $inc's the delta into the
+`quantileSketches` document and reloads the merged view from it.
+"""
+import os
+import math
+import bisect
+import datetime
+import threading
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+SKETCH_RELATIVE_ACCURACY        = float(os.getenv('SKETCH_RELATIVE_ACCURACY', '0.01'))
+SKETCH_PERSIST_INTERVAL_SECONDS = int(os.getenv('SKETCH_PERSIST_INTERVAL_SECONDS', '30'))
+
+XP_SKETCH = 'xp'
+
+
+class QuantileSketch:
+    """
+    Mergeable histogram over log-spaced buckets with relative accuracy *accuracy*.
+    A *signed* sketch keeps negative counts too — used for deltas, where taking
+    out a value that was added before the last persist must survive until the
+    $inc.
+    """
+
+    def __init__(self, counts: dict = None, accuracy: float = SKETCH_RELATIVE_ACCURACY,
+                 signed: bool = False):
+        gamma            = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma  = math.log(gamma)
+        self.signed      = signed
+        self.counts      = {int(k): n for k, n in (counts or {}).items() if self._keep(n)}
+        self._cumulative = None          # (sorted bucket ids, counts before each) cache
+
+    def _keep(self, count) -> bool:
+        return count != 0 if self.signed else count > 0
+
+    def bucket(self, value) -> int:
+        return -1 if value < 1 else math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value, n: int = 1):
+        """Add (n > 0) or take out (n < 0) a value."""
+        key   = self.bucket(value)
+        count = self.counts.get(key, 0) + n
+        if self._keep(count):
+            self.counts[key] = count
+        else:
+            self.counts.pop(key, None)
+        self._cumulative = None
+
+    def merge(self, other: 'QuantileSketch'):
+        for key, n in other.counts.items():
+            count = self.counts.get(key, 0) + n
+            if self._keep(count):
+                self.counts[key] = count
+            else:
+                self.counts.pop(key, None)
+        self._cumulative = None
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def fraction_below(self, value) -> float:
+        """Approximate share of values strictly below *value* (ties count half)."""
+        if self._cumulative is None:
+            keys, before, running = sorted(self.counts), [], 0
+            for key in keys:
+                before.append(running)
+                running += self.counts[key]
+            self._cumulative = (keys, before, running)
+
+        keys, before, total = self._cumulative
+        if total == 0:
+            return 0.0
+        key = self.bucket(value)
+        i   = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return (before[i] + self.counts[key] / 2) / total
+        return (before[i] if i < len(keys) else total) / total
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Per-process registry + persistence
+# ─────────────────────────────────────────────────────────────────────────────
+_views  = {}      # name → QuantileSketch (persisted + local changes)
+_deltas = {}      # name → QuantileSketch (local changes not yet persisted)
+_lock   = threading.Lock()
+
+
+def _contest_sketch_name(contest_id) -> str:
+    return f'contest:{contest_id}'
+
+
+def _seed_counts(db, name: str) -> dict:
+    """Initial sketch for a name that has never been persisted."""
+    sketch = QuantileSketch()
+    if name == XP_SKETCH:
+        for entry in db.globalLeaderboard.find({}, {'xp': 1, '_id': 0}):
+            sketch.add(entry.get('xp', 0))
+    else:
+        contest_oid = ObjectId(name.split(':', 1)[1])
+        for entry in db.contestLeaderboard.find(
+            {'contestId': contest_oid, 'isSubmitted': True}, {'score': 1, '_id': 0}
+        ):
+            sketch.add(entry.get('score', 0))
+    return sketch.counts
+
+
+def _load_view(db, name: str):
+    """(merged sketch, seeded) for *name*.  *seeded* is True when this call built
+    the sketch from current Mongo data, which then already includes the change
+    being recorded."""
+    view = _views.get(name)
+    if view is not None:
+        return view, False
+
+    seeded = False
+    doc    = db.quantileSketches.find_one({'_id': name})
+    if doc is None:
+        try:
+            db.quantileSketches.insert_one({
+                '_id':       name,
+                'counts':    {str(k): n for k, n in _seed_counts(db, name).items()},
+                'updatedAt': datetime.datetime.utcnow()
+            })
+            seeded = True
+        except DuplicateKeyError:
+            pass   # seeded concurrently by another worker
+        doc = db.quantileSketches.find_one({'_id': name})
+
+    with _lock:
+        return _views.setdefault(name, QuantileSketch(doc.get('counts'))), seeded
+
+
+def _record(db, name: str, changes: list):
+    """Apply [(value, n), ...] to the local view and delta of one sketch."""
+    view, seeded = _load_view(db, name)
+    if seeded:
+        return
+    with _lock:
+        delta = _deltas.setdefault(name, QuantileSketch(signed=True))
+        for value, n in changes:
+            view.add(value, n)
+            delta.add(value, n)
+
+
+def persist_sketches(db) -> int:
+    """$inc local deltas into quantileSketches and reload the merged views.  Scheduled job."""
+    with _lock:
+        pending = {name: delta for name, delta in _deltas.items() if delta.counts}
+        _deltas.clear()
+
+    items = list(pending.items())
+    for i, (name, delta) in enumerate(items):
+        try:
+            db.quantileSketches.update_one(
+                {'_id': name},
+                {
+                    '$inc': {f'counts.{k}': n for k, n in delta.counts.items()},
+                    '$set': {'updatedAt': datetime.datetime.utcnow()}
+                }
+            )
+        except Exception:
+            # Put this and every unwritten delta back so the next run retries them
+            with _lock:
+                for unwritten, unwritten_delta in items[i:]:
+                    _deltas.setdefault(unwritten, QuantileSketch(signed=True)).merge(unwritten_delta)
+            raise
+
+    # Refresh every loaded view so other workers' changes become visible
+    for name in list(_views):
+        doc = db.quantileSketches.find_one({'_id': name})
+        if doc is None:
+            continue
+        with _lock:
+            view = QuantileSketch(doc.get('counts'))
+            delta = _deltas.get(name)        # recorded while we were writing
+            if delta is not None:
+                view.merge(delta)
+            _views[name] = view
+    return len(pending)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  XP and contest score sketches
+# ─────────────────────────────────────────────────────────────────────────────
+def record_xp_change(db, old_xp, new_xp):
+    """A student's XP moved from *old_xp* (None for a new student) to *new_xp*."""
+    if old_xp == new_xp:
+        return
+    changes = [(new_xp, 1)]
+    if old_xp is not None:
+        changes.append((old_xp, -1))
+    _record(db, XP_SKETCH, changes)
+
+
+def xp_percentile(db, xp) -> float:
+    """Percentage of students with less XP than *xp* (approximate)."""
+    return round(100 * _load_view(db, XP_SKETCH)[0].fraction_below(xp), 1)
+
+
+def record_contest_score(db, contest_id, score):
+    _record(db, _contest_sketch_name(contest_id), [(score, 1)])
+
+
+def contest_percentile(db, contest_id, score) -> float:
+    """Percentage of the contest's submissions that scored lower (approximate)."""
+    return round(100 * _load_view(db, _contest_sketch_name(contest_id))[0].fraction_below(score), 1)
+
+
+def drop_contest_sketch(db, contest_id):
+    name = _contest_sketch_name(contest_id)
+    db.quantileSketches.delete_one({'_id': name})
+    with _lock:
+        _views.pop(name, None)
+        _deltas.pop(name, None)
+
+
+def reset_xp_sketch(db):
+    """Re-seed the XP sketch from globalLeaderboard (after a full rebuild)."""
+    db.quantileSketches.replace_one(
+        {'_id': XP_SKETCH},
+        {
+            'counts':    {str(k): n for k, n in _seed_counts(db, XP_SKETCH).items()},
+            'updatedAt': datetime.datetime.utcnow()
+        },
+        upsert=True
+    )
+    with _lock:
+        _views.pop(XP_SKETCH, None)
+        _deltas.pop(XP_SKETCH, None)
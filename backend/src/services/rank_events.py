@@ -0,0 +1,108 @@
+"""
+rank_events.py
+In-process fan-out of leaderboard rank deltas to Server-Sent Events streams.
+
+Each SSE connection subscribes to one board (GLOBAL_BOARD or a contest id)
+and gets its own small bounded queue; leaderboard_service calls publish()
+whenever ranks on that board change.  Publishing is a non-blocking put per
+subscriber, and an idle connection costs one queue and one waiting thread
+(or greenlet) woken every SSE_HEARTBEAT_SECONDS for a keep-alive comment.
+
+A subscriber that falls SSE_QUEUE_SIZE events behind has its backlog
+dropped and receives a single `resync` event telling the client to re-fetch
+the board.  No external broker is involved, so a subscriber only ever sees
+the changes applied by the worker process holding its connection — changes
+applied by other workers reach it only through a re-fetch (on `resync` or
+reconnect).
+
+Streams hold their worker for as long as the client is connected, so the
+Procfile runs gunicorn's gevent worker class (one greenlet per connection).
+At most SSE_MAX_STREAMS streams are open per worker; beyond that the stream
+endpoints answer 503, which keeps room for ordinary API requests.
+"""
+import os
+import json
+import queue
+import threading
+
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_QUEUE_SIZE        = int(os.getenv('SSE_QUEUE_SIZE', '100'))
+SSE_MAX_STREAMS       = int(os.getenv('SSE_MAX_STREAMS', '1000'))
+
+_subscribers = {}      # board → set of queue.Queue
+_open        = 0       # subscribers across all boards
+_lock        = threading.Lock()
+
+
+def subscribe(board) -> queue.Queue:
+    global _open
+    q = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(board, set()).add(q)
+        _open += 1
+    return q
+
+
+def unsubscribe(board, q: queue.Queue):
+    global _open
+    with _lock:
+        subs = _subscribers.get(board)
+        if subs is not None and q in subs:
+            subs.discard(q)
+            _open -= 1
+            if not subs:
+                del _subscribers[board]
+
+
+def at_capacity() -> bool:
+    """True once this worker holds SSE_MAX_STREAMS open streams."""
+    return _open >= SSE_MAX_STREAMS
+
+
+def has_subscribers(board) -> bool:
+    return bool(_subscribers.get(board))
+
+
+def publish(board, event: str, data: dict):
+    """Queue one event for every subscriber of *board*."""
+    with _lock:
+        subs = list(_subscribers.get(board, ()))
+    if not subs:
+        return
+    message = format_event(event, data)
+    for q in subs:
+        try:
+            q.put_nowait(message)
+        except queue.Full:
+            _resync(q)
+
+
+def _resync(q: queue.Queue):
+    """Replace a slow subscriber's backlog with a single resync event."""
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        q.put_nowait(format_event('resync', {}))
+    except queue.Full:
+        pass
+
+
+def format_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+
+def stream(board):
+    """Generator of SSE text for one subscriber; unsubscribes when the client goes away."""
+    q = subscribe(board)
+    try:
+        yield f"retry: 3000\n{format_event('ready', {'board': str(board)})}"
+        while True:
+            try:
+                yield q.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+    finally:
+        unsubscribe(board, q)
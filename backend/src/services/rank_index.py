@@ -0,0 +1,173 @@
+"""
+rank_index.py
+In-process order-statistic index for leaderboards.
+
+An indexable skip list (each forward pointer carries its span) keyed by an
+arbitrary sortable tuple.  Lower keys rank first.  All operations are
+O(log N) expected:
+  - upsert(member, key, value)  — insert or move a member
+  - remove(member)
+  - rank_of(member)             — 1-based rank, or None
+  - top(k, offset)              — members at ranks offset+1 .. offset+k
+"""
+import random
+import threading
+
+_MAX_LEVEL   = 32
+_PROBABILITY = 0.25
+
+
+class _Node:
+    __slots__ = ('key', 'member', 'value', 'forward', 'span')
+
+    def __init__(self, key, member, value, level: int):
+        self.key     = key
+        self.member  = member
+        self.value   = value
+        self.forward = [None] * level
+        self.span    = [0] * level
+
+
+class RankIndex:
+    """Thread-safe indexable skip list mapping member → (key, value)."""
+
+    def __init__(self):
+        self._head   = _Node(None, None, None, _MAX_LEVEL)
+        self._level  = 1
+        self._length = 0
+        self._nodes  = {}            # member → _Node
+        self._lock   = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __contains__(self, member) -> bool:
+        return member in self._nodes
+
+    # ── Public API ────────────────────────────────────────────────────────────
+    def upsert(self, member, key, value=None):
+        """Insert *member* at *key*, or move it there if already present."""
+        with self._lock:
+            node = self._nodes.get(member)
+            if node is not None:
+                if node.key == key:
+                    node.value = value
+                    return
+                self._delete(node.key)
+            self._nodes[member] = self._insert(key, member, value)
+
+    def remove(self, member) -> bool:
+        with self._lock:
+            node = self._nodes.pop(member, None)
+            if node is None:
+                return False
+            self._delete(node.key)
+            return True
+
+    def get(self, member):
+        """Return the stored value for *member* (or None)."""
+        node = self._nodes.get(member)
+        return node.value if node is not None else None
+
+    def rank_of(self, member):
+        """1-based rank of *member*, or None if it isn't indexed."""
+        with self._lock:
+            node = self._nodes.get(member)
+            if node is None:
+                return None
+            return self._rank(node.key)
+
+    def top(self, k: int, offset: int = 0) -> list:
+        """Return [(rank, member, value), ...] for ranks offset+1 .. offset+k."""
+        with self._lock:
+            result = []
+            rank   = offset + 1
+            node   = self._node_at(rank)
+            while node is not None and len(result) < k:
+                result.append((rank, node.member, node.value))
+                node = node.forward[0]
+                rank += 1
+            return result
+
+    # ── Skip list internals ───────────────────────────────────────────────────
+    @staticmethod
+    def _random_level() -> int:
+        level = 1
+        while level < _MAX_LEVEL and random.random() < _PROBABILITY:
+            level += 1
+        return level
+
+    def _insert(self, key, member, value) -> _Node:
+        update = [None] * _MAX_LEVEL
+        rank   = [0] * _MAX_LEVEL
+        x = self._head
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while x.forward[i] is not None and x.forward[i].key < key:
+                rank[i] += x.span[i]
+                x = x.forward[i]
+            update[i] = x
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i]   = 0
+                update[i] = self._head
+                self._head.span[i] = self._length
+            self._level = level
+
+        node = _Node(key, member, value, level)
+        for i in range(level):
+            node.forward[i]      = update[i].forward[i]
+            update[i].forward[i] = node
+            node.span[i]         = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i]    = (rank[0] - rank[i]) + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+
+        self._length += 1
+        return node
+
+    def _delete(self, key):
+        update = [None] * _MAX_LEVEL
+        x = self._head
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and x.forward[i].key < key:
+                x = x.forward[i]
+            update[i] = x
+
+        target = x.forward[0]
+        for i in range(self._level):
+            if update[i].forward[i] is target:
+                update[i].span[i]   += target.span[i] - 1
+                update[i].forward[i] = target.forward[i]
+            else:
+                update[i].span[i] -= 1
+
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+
+    def _rank(self, key):
+        rank = 0
+        x = self._head
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and x.forward[i].key <= key:
+                rank += x.span[i]
+                x = x.forward[i]
+            if x is not self._head and x.key == key:
+                return rank
+        return None
+
+    def _node_at(self, rank: int):
+        if rank < 1 or rank > self._length:
+            return None
+        traversed = 0
+        x = self._head
+        for i in range(self._level - 1, -1, -1):
+            while x.forward[i] is not None and traversed + x.span[i] <= rank:
+                traversed += x.span[i]
+                x = x.forward[i]
+            if traversed == rank:
+                return x
+        return None
@@ -0,0 +1,85 @@
+"""
+response_cache.py
+Per-process read-through cache of leaderboard responses as serialized JSON bytes.
+
+Entries are grouped by board (GLOBAL_BOARD or a contest id) and by request
+variant (e.g. page size + cursor).  leaderboard_service invalidates a board
+whenever it publishes new ranks for it; the TTL bounds staleness for changes
+published by another worker process.
+
+The cache holds at most RESPONSE_CACHE_MAX_ENTRIES responses: expired entries
+are dropped first, then the least recently used ones.
+
+Loading is single-flight: on a miss exactly one request runs the loader
+while concurrent requests for the same entry wait for its result.
+"""
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from flask import Response
+
+RESPONSE_CACHE_TTL_SECONDS  = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '5'))
+RESPONSE_CACHE_MAX_ENTRIES  = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+
+_entries     = OrderedDict()   # (board, variant) → (storedAt, body bytes), LRU first
+_generations = {}     # board → invalidation counter
+_inflight    = {}     # (board, variant) → Event set when the load finishes
+_lock        = threading.Lock()
+
+
+def cached_json(board, variant, loader) -> Response:
+    """Serve loader()'s JSON-serializable result for (board, variant) from cache."""
+    key = (board, variant)
+    while True:
+        with _lock:
+            hit = _entries.get(key)
+            if hit is not None:
+                if time.monotonic() - hit[0] < RESPONSE_CACHE_TTL_SECONDS:
+                    _entries.move_to_end(key)
+                    return _response(hit[1])
+                del _entries[key]
+            event = _inflight.get(key)
+            if event is None:
+                event = _inflight[key] = threading.Event()
+                generation = _generations.get(board, 0)
+                break
+        # Someone else is loading this entry — wait, then re-check the cache
+        event.wait()
+
+    try:
+        body = json.dumps(loader(), separators=(',', ':')).encode()
+        with _lock:
+            # Don't store a result that an invalidation has already superseded
+            if _generations.get(board, 0) == generation:
+                _entries[key] = (time.monotonic(), body)
+                _entries.move_to_end(key)
+                if len(_entries) > RESPONSE_CACHE_MAX_ENTRIES:
+                    _evict()
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        event.set()
+    return _response(body)
+
+
+def invalidate_board(board):
+    """Drop every cached response of one board."""
+    with _lock:
+        for key in [k for k in _entries if k[0] == board]:
+            del _entries[key]
+        _generations[board] = _generations.get(board, 0) + 1
+
+
+def _evict():
+    """Trim the cache to RESPONSE_CACHE_MAX_ENTRIES.  Call with _lock held."""
+    cutoff = time.monotonic() - RESPONSE_CACHE_TTL_SECONDS
+    for key in [k for k, (stored_at, _) in _entries.items() if stored_at <= cutoff]:
+        del _entries[key]
+    while len(_entries) > RESPONSE_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+def _response(body: bytes) -> Response:
+    return Response(body, mimetype='application/json')
@@ -0,0 +1,53 @@
+"""
+scheduler.py
+Minimal in-process periodic job runner.
+
+Each registered job runs on its own daemon thread every `interval` seconds
+with the app context pushed and the db handle passed in.  Jobs must be
+idempotent: with several gunicorn workers every worker runs its own copy.
+Set SCHEDULER_ENABLED=false to disable (e.g. for one-off scripts).
+"""
+import os
+import logging
+import threading
+
+from src.db import get_db
+
+logger = logging.getLogger(__name__)
+
+_jobs    = []          # [(name, interval_seconds, fn)]
+_started = False
+_lock    = threading.Lock()
+
+
+def register_job(name: str, interval_seconds: float, fn):
+    """Register fn(db) to run every interval_seconds once the scheduler starts."""
+    _jobs.append((name, interval_seconds, fn))
+
+
+def start_scheduler(app):
+    """Start one daemon thread per registered job (idempotent)."""
+    global _started
+    if os.getenv('SCHEDULER_ENABLED', 'true').lower() != 'true':
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    for name, interval, fn in _jobs:
+        thread = threading.Thread(
+            target=_run_forever, args=(app, name, interval, fn),
+            name=f'job:{name}', daemon=True
+        )
+        thread.start()
+
+
+def _run_forever(app, name, interval, fn):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        try:
+            with app.app_context():
+                fn(get_db())
+        except Exception:
+            logger.exception("Scheduled job %s failed", name)
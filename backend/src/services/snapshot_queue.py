@@ -0,0 +1,143 @@
+"""
+snapshot_queue.py
+Asynchronous userProgress + globalLeaderboard refresh after quiz submits.
+
+submit_quiz records the student in the `snapshotOutbox` collection (one
+document per student) and hands the id to an in-process queue drained by a
+small worker pool, so the request returns as soon as the attempt and the
+users update are durable.
+
+  • Coalescing — repeated submits by the same student only bump the outbox
+    document's `seq`; a worker re-reads the users document, so one refresh
+    covers every pending submit.
+  • Durability — a worker leases the entry, refreshes, then deletes it only
+    if `seq` is unchanged.  Entries left behind by a crashed process (or
+    enqueued in another worker process) are picked up by the
+    recover_snapshot_outbox scheduler job once their lease has expired.
+
+SNAPSHOT_WORKERS=0 disables the pool and refreshes inline.
+"""
+import os
+import uuid
+import queue
+import logging
+import datetime
+import threading
+
+from src.db import get_db
+from src.leaderboard_service import update_student_snapshots
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_WORKERS                  = int(os.getenv('SNAPSHOT_WORKERS', '2'))
+SNAPSHOT_LEASE_SECONDS            = int(os.getenv('SNAPSHOT_LEASE_SECONDS', '60'))
+SNAPSHOT_RECOVER_INTERVAL_SECONDS = int(os.getenv('SNAPSHOT_RECOVER_INTERVAL_SECONDS', '30'))
+
+_queue   = queue.Queue()
+_queued  = set()                 # student ids currently waiting in _queue
+_owner   = uuid.uuid4().hex      # identifies this process's leases
+_started = False
+_lock    = threading.Lock()
+
+
+def enqueue_snapshot(db, student_oid):
+    """Record a pending snapshot refresh for *student_oid* and schedule it."""
+    now = datetime.datetime.utcnow()
+    db.snapshotOutbox.update_one(
+        {'studentId': student_oid},
+        {
+            '$inc':         {'seq': 1},
+            '$set':         {'enqueuedAt': now},
+            '$setOnInsert': {'leaseUntil': None}
+        },
+        upsert=True
+    )
+    if not _started:
+        _process(db, student_oid)
+        return
+    _schedule(student_oid)
+
+
+def start_snapshot_workers():
+    """Start the worker pool (idempotent)."""
+    global _started
+    if SNAPSHOT_WORKERS <= 0:
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+
+    for i in range(SNAPSHOT_WORKERS):
+        threading.Thread(target=_worker, name=f'snapshot-worker:{i}', daemon=True).start()
+
+
+def recover_snapshot_outbox(db) -> int:
+    """Queue outbox entries nobody holds a live lease on.  Scheduled job."""
+    if not _started:
+        return 0
+    now     = datetime.datetime.utcnow()
+    pending = db.snapshotOutbox.find(
+        {'$or': [{'leaseUntil': None}, {'leaseUntil': {'$lt': now}}]},
+        {'studentId': 1}
+    )
+    count = 0
+    for entry in pending:
+        _schedule(entry['studentId'])
+        count += 1
+    return count
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Workers
+# ─────────────────────────────────────────────────────────────────────────────
+def _schedule(student_oid):
+    with _lock:
+        if student_oid in _queued:
+            return
+        _queued.add(student_oid)
+    _queue.put(student_oid)
+
+
+def _worker():
+    while True:
+        student_oid = _queue.get()
+        with _lock:
+            _queued.discard(student_oid)
+        try:
+            _process(get_db(), student_oid)
+        except Exception:
+            # The lease expires and recover_snapshot_outbox retries the entry
+            logger.exception("Snapshot refresh failed for %s", student_oid)
+
+
+def _process(db, student_oid):
+    """Lease the outbox entry, refresh the snapshots, then retire the entry."""
+    now   = datetime.datetime.utcnow()
+    entry = db.snapshotOutbox.find_one_and_update(
+        {
+            'studentId': student_oid,
+            '$or': [{'leaseUntil': None}, {'leaseUntil': {'$lt': now}}]
+        },
+        {'$set': {
+            'leaseUntil': now + datetime.timedelta(seconds=SNAPSHOT_LEASE_SECONDS),
+            'leasedBy':   _owner
+        }},
+        projection={'seq': 1}
+    )
+    if entry is None:
+        return  # already done, or another worker holds it
+
+    update_student_snapshots(db, student_oid)
+
+    retired = db.snapshotOutbox.delete_one({'_id': entry['_id'], 'seq': entry['seq']})
+    if retired.deleted_count == 0:
+        # Submitted again while we were refreshing — release and go again
+        db.snapshotOutbox.update_one(
+            {'_id': entry['_id'], 'leasedBy': _owner},
+            {'$set': {'leaseUntil': None}}
+        )
+        if _started:
+            _schedule(student_oid)
+        else:
+            _process(db, student_oid)
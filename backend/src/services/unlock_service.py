@@ -0,0 +1,392 @@
+"""
+unlock_service.py
+Per-(studentId, moduleId) unlock state in `moduleUnlocks`, plus a
+write-behind buffer for video progress heartbeats.
+
+State changes go through transition_unlock: ONE find_one_and_update with an
+update pipeline that merges video positions (watchedSec only moves forward)
+and re-derives videoSatisfied and isUnlocked, returning the new document.
+Concurrent writers therefore can't lose each other's progress, and no
+request reads the document back after writing it.
+
+The reading timer is never written: reading_timer_satisfied derives it from
+readingStartedAt + readSecondsRequired whenever it's needed (the stored
+readTimerSatisfied is only True when the module doesn't require reading).
+unlock_view evaluates the whole state without touching Mongo, so GET
+/unlock-status is a pure read; isUnlocked is persisted on first need — by
+persist_unlock_if_due from the quiz gate and POST endpoints, or by the
+next video progress transition.
+
+While a video plays the frontend posts a "timeupdate" heartbeat every few
+seconds.  Those only move watchedSec forward, so record_heartbeat keeps the
+latest position per (student, module, video) in memory and answers from a
+cached copy of the unlock document.  Buffered positions are written to
+Mongo when
+  • the video ends or is paused,
+  • a heartbeat would mark a video completed (and so may flip
+    videoSatisfied / isUnlocked) — flushed synchronously, before responding,
+  • the entry has been dirty for HEARTBEAT_FLUSH_INTERVAL_SECONDS, or
+  • the flush_heartbeats scheduler job runs.
+At worst a crash loses the last few seconds of watch position, never a
+completion.
+"""
+import os
+import time
+import datetime
+import threading
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Minimum seconds to read content before reading timer is satisfied
+DEFAULT_READ_SECONDS = 300   # 5 minutes
+
+# A video counts as watched once this share of it has been played
+VIDEO_COMPLETE_RATIO = 0.95
+
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = int(os.getenv('HEARTBEAT_FLUSH_INTERVAL_SECONDS', '60'))
+HEARTBEAT_IDLE_SECONDS           = int(os.getenv('HEARTBEAT_IDLE_SECONDS', '300'))
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Unlock document helpers
+# ─────────────────────────────────────────────────────────────────────────────
+def _empty_video_progress(index: int) -> dict:
+    return {
+        'videoIndex':   index,
+        'durationSec':  0,
+        'watchedSec':   0,
+        'completed':    False,
+        'lastUpdateAt': None
+    }
+
+
+def get_or_create_unlock(db, student_oid: ObjectId, module_oid: ObjectId) -> dict:
+    """Fetch the unlock document; create it if it doesn't exist yet."""
+    doc = db.moduleUnlocks.find_one({
+        'studentId': student_oid,
+        'moduleId':  module_oid
+    })
+    if doc:
+        return doc
+
+    # Fetch module config
+    module = db.modules.find_one({'_id': module_oid}) or {}
+    requires_video   = module.get('requiresVideoCompletion', True)
+    requires_reading = module.get('requiresReadingTime', True)
+    min_read_secs    = int(module.get('minReadSeconds', DEFAULT_READ_SECONDS))
+    video_links      = module.get('videoLinks', [])
+
+    # Build initial videoProgress list (one entry per video)
+    video_progress = [_empty_video_progress(i) for i in range(len(video_links))]
+
+    now = datetime.datetime.utcnow()
+    doc = {
+        'studentId':          student_oid,
+        'moduleId':           module_oid,
+        'openedAt':           now,
+        'readSecondsRequired': min_read_secs,
+        'readTimerSatisfied': False,
+        'readingStartedAt':   now,    # timer anchored to first open
+        'videoRequired':      requires_video,
+        'videoProgress':      video_progress,
+        'videoSatisfied':     not requires_video or len(video_links) == 0,
+        'isUnlocked':         False,
+        'unlockedAt':         None,
+    }
+
+    # If reading is not required, reading condition is already met
+    if not requires_reading:
+        doc['readTimerSatisfied'] = True
+
+    try:
+        db.moduleUnlocks.insert_one(doc)
+    except DuplicateKeyError:
+        # Created concurrently by another request
+        doc = db.moduleUnlocks.find_one({'studentId': student_oid, 'moduleId': module_oid})
+    return doc
+
+
+def reading_seconds_elapsed(doc: dict) -> int:
+    """How many seconds have elapsed since the module was first opened."""
+    started = doc.get('readingStartedAt') or doc.get('openedAt')
+    if not started:
+        return 0
+    now = datetime.datetime.utcnow()
+    return max(0, int((now - started).total_seconds()))
+
+
+def reading_timer_satisfied(doc: dict) -> bool:
+    """Reading condition, derived from readingStartedAt + readSecondsRequired."""
+    if doc.get('readTimerSatisfied'):
+        return True
+    return reading_seconds_elapsed(doc) >= doc.get('readSecondsRequired', DEFAULT_READ_SECONDS)
+
+
+def unlock_view(doc: dict) -> dict:
+    """*doc* with readTimerSatisfied and isUnlocked evaluated as of now.  No write."""
+    view = dict(doc)
+    view['readTimerSatisfied'] = reading_timer_satisfied(doc)
+    if view['readTimerSatisfied'] and view.get('videoSatisfied'):
+        view['isUnlocked'] = True
+    return view
+
+
+def persist_unlock_if_due(db, doc: dict) -> dict:
+    """Store isUnlocked the first time the derived state says so.  Returns the
+    (possibly updated) doc; a no-op for already-unlocked or still-locked docs."""
+    if doc.get('isUnlocked') or not unlock_view(doc)['isUnlocked']:
+        return doc
+    return transition_unlock(db, doc['studentId'], doc['moduleId'], create=False) or doc
+
+
+def serialize_unlock(doc: dict) -> dict:
+    """Convert ObjectIds and datetimes to serialisable primitives."""
+    d = dict(doc)
+    d['_id']       = str(d['_id'])
+    d['studentId'] = str(d['studentId'])
+    d['moduleId']  = str(d['moduleId'])
+
+    for dt_field in ('openedAt', 'unlockedAt', 'readingStartedAt'):
+        if d.get(dt_field) and hasattr(d[dt_field], 'isoformat'):
+            d[dt_field] = d[dt_field].isoformat() + 'Z'
+
+    d['videoProgress'] = [dict(vp) for vp in d.get('videoProgress', [])]
+    for vp in d['videoProgress']:
+        if vp.get('lastUpdateAt') and hasattr(vp['lastUpdateAt'], 'isoformat'):
+            vp['lastUpdateAt'] = vp['lastUpdateAt'].isoformat() + 'Z'
+
+    return d
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Video progress
+# ─────────────────────────────────────────────────────────────────────────────
+def _merge_position(vp: dict, position: dict) -> dict:
+    """*vp* advanced by one buffered position {durationSec, watchedSec, ended, at}."""
+    vp = dict(vp)
+    if position['durationSec'] > 0:
+        vp['durationSec'] = position['durationSec']
+    vp['watchedSec']   = max(vp.get('watchedSec', 0), position['watchedSec'])
+    vp['lastUpdateAt'] = position['at']
+
+    # Mark completed if ended OR watched ≥ 95%
+    if not vp.get('completed', False):
+        duration    = vp.get('durationSec', 0)
+        watch_ratio = (vp['watchedSec'] / duration) if duration > 0 else 0
+        if position['ended'] or watch_ratio >= VIDEO_COMPLETE_RATIO:
+            vp['completed'] = True
+    return vp
+
+
+def _with_positions(doc: dict, positions: dict) -> list:
+    """doc's videoProgress with {videoIndex: position} merged in."""
+    video_progress = list(doc.get('videoProgress', []))
+    for video_index in sorted(positions):
+        # Ensure entry exists for this video index
+        while len(video_progress) <= video_index:
+            video_progress.append(_empty_video_progress(len(video_progress)))
+        video_progress[video_index] = _merge_position(video_progress[video_index], positions[video_index])
+    return video_progress
+
+
+def _merged_position_expr(position: dict) -> dict:
+    """Aggregation twin of _merge_position for the element bound to $$vp."""
+    duration = position['durationSec'] if position['durationSec'] > 0 else {'$ifNull': ['$$vp.durationSec', 0]}
+    return {'$let': {
+        'vars': {
+            'duration': duration,
+            'watched':  {'$max': [{'$ifNull': ['$$vp.watchedSec', 0]}, position['watchedSec']]}
+        },
+        'in': {'$mergeObjects': ['$$vp', {
+            'durationSec':  '$$duration',
+            'watchedSec':   '$$watched',
+            'lastUpdateAt': position['at'],
+            'completed':    {'$or': [
+                {'$ifNull': ['$$vp.completed', False]},
+                position['ended'],
+                {'$and': [
+                    {'$gt': ['$$duration', 0]},
+                    {'$gte': ['$$watched', {'$multiply': ['$$duration', VIDEO_COMPLETE_RATIO]}]}
+                ]}
+            ]}
+        }]}
+    }}
+
+
+def _video_progress_stage(positions: dict) -> dict:
+    """$set stage merging {videoIndex: position} into videoProgress.  watchedSec
+    is a per-element $max, so concurrent writers can only move it forward."""
+    size     = {'$max': [{'$size': {'$ifNull': ['$videoProgress', []]}}, max(positions) + 1]}
+    branches = [
+        {'case': {'$eq': ['$$i', video_index]}, 'then': _merged_position_expr(position)}
+        for video_index, position in sorted(positions.items())
+    ]
+    return {'$set': {'videoProgress': {'$map': {
+        'input': {'$range': [0, size]},
+        'as':    'i',
+        'in':    {'$let': {
+            # Ensure entry exists for this video index
+            'vars': {'vp': {'$ifNull': [
+                {'$arrayElemAt': ['$videoProgress', '$$i']},
+                {**_empty_video_progress(0), 'videoIndex': '$$i'}
+            ]}},
+            'in':   {'$switch': {'branches': branches, 'default': '$$vp'}}
+        }}
+    }}}}
+
+
+def _unlock_state_stages(now: datetime.datetime) -> list:
+    """Stages re-deriving videoSatisfied, isUnlocked and unlockedAt from the
+    stored fields.  Each flag only ever goes False → True.  The reading timer
+    is evaluated inline (see reading_timer_satisfied) and never stored."""
+    started = {'$ifNull': ['$readingStartedAt', {'$ifNull': ['$openedAt', now]}]}
+    return [
+        {'$set': {
+            # All videos must be completed (trivially true when there are none)
+            'videoSatisfied': {'$or': [
+                {'$ifNull': ['$videoSatisfied', False]},
+                {'$eq': ['$videoRequired', False]},
+                {'$allElementsTrue': [{'$map': {
+                    'input': {'$ifNull': ['$videoProgress', []]},
+                    'as':    'vp',
+                    'in':    {'$ifNull': ['$$vp.completed', False]}
+                }}]}
+            ]}
+        }},
+        {'$set': {
+            'isUnlocked': {'$or': [
+                {'$ifNull': ['$isUnlocked', False]},
+                {'$and': [
+                    '$videoSatisfied',
+                    {'$or': [
+                        {'$ifNull': ['$readTimerSatisfied', False]},
+                        {'$gte': [
+                            {'$divide': [{'$subtract': [now, started]}, 1000]},
+                            {'$ifNull': ['$readSecondsRequired', DEFAULT_READ_SECONDS]}
+                        ]}
+                    ]}
+                ]}
+            ]}
+        }},
+        {'$set': {
+            'unlockedAt': {'$cond': ['$isUnlocked', {'$ifNull': ['$unlockedAt', now]}, None]}
+        }}
+    ]
+
+
+def transition_unlock(db, student_oid: ObjectId, module_oid: ObjectId,
+                      positions: dict = None, create: bool = True):
+    """Merge buffered video positions (if any) and re-derive the unlock state in
+    ONE atomic find_one_and_update.  Returns the document after the update, or
+    None when it doesn't exist and *create* is False."""
+    now      = datetime.datetime.utcnow()
+    query    = {'studentId': student_oid, 'moduleId': module_oid}
+    pipeline = ([_video_progress_stage(positions)] if positions else []) + _unlock_state_stages(now)
+
+    doc = db.moduleUnlocks.find_one_and_update(query, pipeline, return_document=ReturnDocument.AFTER)
+    if doc is None and create:
+        get_or_create_unlock(db, student_oid, module_oid)
+        doc = db.moduleUnlocks.find_one_and_update(query, pipeline, return_document=ReturnDocument.AFTER)
+    return doc
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Heartbeat write-behind buffer
+# ─────────────────────────────────────────────────────────────────────────────
+_entries = {}      # (studentId, moduleId) → _HeartbeatEntry
+_lock    = threading.Lock()
+
+
+class _HeartbeatEntry:
+    """Cached unlock doc of one (student, module) plus positions not yet written."""
+
+    def __init__(self, doc: dict):
+        self.doc         = doc
+        self.positions   = {}       # videoIndex → latest buffered position
+        self.dirty_since = None     # monotonic time of the oldest unwritten heartbeat
+        self.touched_at  = time.monotonic()
+        self.flush_lock  = threading.Lock()
+
+
+def _entry_for(db, key) -> _HeartbeatEntry:
+    with _lock:
+        entry = _entries.get(key)
+    if entry is None:
+        entry = _HeartbeatEntry(get_or_create_unlock(db, *key))
+        with _lock:
+            entry = _entries.setdefault(key, entry)
+    return entry
+
+
+def _flush_entry(db, key, entry: _HeartbeatEntry) -> dict:
+    with entry.flush_lock:
+        with _lock:
+            positions, entry.positions = entry.positions, {}
+            entry.dirty_since = None
+        if positions:
+            entry.doc = transition_unlock(db, key[0], key[1], positions)
+        return entry.doc
+
+
+def record_heartbeat(db, student_oid: ObjectId, module_oid: ObjectId, video_index: int,
+                     duration_sec: float, current_time: float, event_type: str):
+    """Record one video progress event.  Returns (unlock doc, videoProgress) as
+    the student should see them, buffered positions included."""
+    key   = (student_oid, module_oid)
+    entry = _entry_for(db, key)
+    now   = datetime.datetime.utcnow()
+
+    with _lock:
+        buffered = entry.positions.get(video_index)
+        entry.positions[video_index] = {
+            'durationSec': duration_sec if duration_sec > 0 else (buffered or {}).get('durationSec', 0),
+            'watchedSec':  max(current_time, (buffered or {}).get('watchedSec', 0)),
+            'ended':       event_type == 'ended' or bool(buffered and buffered['ended']),
+            'at':          now
+        }
+        if entry.dirty_since is None:
+            entry.dirty_since = time.monotonic()
+        entry.touched_at = time.monotonic()
+        video_progress   = _with_positions(entry.doc, entry.positions)
+        dirty_for        = time.monotonic() - entry.dirty_since
+
+    # A newly completed video may flip videoSatisfied — never leave that buffered
+    was_completed = video_index < len(entry.doc.get('videoProgress', [])) and \
+                    entry.doc['videoProgress'][video_index].get('completed', False)
+    completes     = video_progress[video_index].get('completed', False) and not was_completed
+
+    if completes or event_type in ('ended', 'paused') or dirty_for >= HEARTBEAT_FLUSH_INTERVAL_SECONDS:
+        doc = _flush_entry(db, key, entry)
+        with _lock:
+            return doc, _with_positions(doc, entry.positions)
+    return entry.doc, video_progress
+
+
+def flush_heartbeats(db) -> int:
+    """Write every buffered position and evict idle entries.  Scheduled job;
+    returns the number of documents written."""
+    with _lock:
+        items = list(_entries.items())
+
+    flushed = 0
+    for key, entry in items:
+        if entry.positions:
+            _flush_entry(db, key, entry)
+            flushed += 1
+
+    idle_before = time.monotonic() - HEARTBEAT_IDLE_SECONDS
+    with _lock:
+        for key, entry in items:
+            if not entry.positions and entry.touched_at < idle_before and _entries.get(key) is entry:
+                del _entries[key]
+    return flushed
+
+
+def refresh_cached_unlock(doc: dict):
+    """Replace the buffer's cached copy of *doc* after a write made outside it
+    (e.g. the reading timer being satisfied on /open)."""
+    with _lock:
+        entry = _entries.get((doc['studentId'], doc['moduleId']))
+        if entry is not None:
+            entry.doc = doc
@@ -0,0 +1,195 @@
+"""
+xp_buckets.py
+Weekly and monthly leaderboards from XP earned in quiz attempts.
+
+Every attempt that earns XP is $inc'ed into one `xpBuckets` row per period
+({period, bucket, studentId, xp}), so a board is a single read of the
+(period, bucket, xp DESC, studentId) index.  Buckets are keyed by calendar
+period — ISO week '2026-W42', month '2026-10' — so a new week or month simply
+starts with empty rows.
+
+The roll_over_xp_buckets scheduler job keeps the current and previous bucket
+of each period live and compacts anything older into one `xpBucketArchive`
+document holding its final top-N.  Archives beyond XP_ARCHIVE_RETENTION per
+period are deleted, so storage stays bounded.  Every worker runs the job, so a
+run holds the XP_ROLLOVER_BOARD board_lock; a worker that finds it taken skips
+the run.
+"""
+import os
+import datetime
+from pymongo import UpdateOne, ASCENDING, DESCENDING
+
+from src.services.board_lock import board_lock, BoardLockTimeout
+
+PERIOD_WEEK  = 'week'
+PERIOD_MONTH = 'month'
+PERIODS      = (PERIOD_WEEK, PERIOD_MONTH)
+
+XP_BOARD_SIZE                       = int(os.getenv('XP_BOARD_SIZE', '100'))
+XP_ARCHIVE_RETENTION                = int(os.getenv('XP_ARCHIVE_RETENTION', '24'))
+XP_BUCKET_ROLLOVER_INTERVAL_SECONDS = int(os.getenv('XP_BUCKET_ROLLOVER_INTERVAL_SECONDS', '3600'))
+XP_ROLLOVER_LEASE_SECONDS           = int(os.getenv('XP_ROLLOVER_LEASE_SECONDS', '300'))
+
+XP_ROLLOVER_BOARD = 'xp-buckets'
+
+_BOARD_ORDER = [('xp', DESCENDING), ('studentId', ASCENDING)]
+
+
+def bucket_key(period: str, at: datetime.datetime) -> str:
+    """Calendar bucket containing *at* (UTC)."""
+    if period == PERIOD_WEEK:
+        year, week, _ = at.isocalendar()
+        return f'{year}-W{week:02d}'
+    return f'{at.year}-{at.month:02d}'
+
+
+def _previous_bucket(period: str, now: datetime.datetime) -> str:
+    if period == PERIOD_WEEK:
+        return bucket_key(period, now - datetime.timedelta(days=7))
+    return bucket_key(period, now.replace(day=1) - datetime.timedelta(days=1))
+
+
+def record_xp(db, student_oid, student_name: str, xp: int, at: datetime.datetime):
+    """Add one attempt's XP to the student's current weekly and monthly buckets."""
+    if xp <= 0:
+        return
+    db.xpBuckets.bulk_write([
+        UpdateOne(
+            {'period': period, 'bucket': bucket_key(period, at), 'studentId': student_oid},
+            {'$inc': {'xp': xp}, '$set': {'studentName': student_name, 'updatedAt': at}},
+            upsert=True
+        )
+        for period in PERIODS
+    ], ordered=False)
+
+
+def period_board(db, period: str, bucket: str = None) -> dict:
+    """Top XP_BOARD_SIZE of one bucket (the current one by default)."""
+    bucket = bucket or bucket_key(period, datetime.datetime.utcnow())
+    rows   = db.xpBuckets.find(
+        {'period': period, 'bucket': bucket},
+        {'studentId': 1, 'studentName': 1, 'xp': 1}
+    ).sort(_BOARD_ORDER).limit(XP_BOARD_SIZE)
+    entries = [_entry(rank, row) for rank, row in enumerate(rows, start=1)]
+    if entries:
+        return {'period': period, 'bucket': bucket, 'entries': entries}
+
+    # Compacted bucket (or simply an empty one)
+    archived = db.xpBucketArchive.find_one({'period': period, 'bucket': bucket})
+    return {
+        'period':  period,
+        'bucket':  bucket,
+        'entries': archived['entries'] if archived else []
+    }
+
+
+def _entry(rank: int, row: dict) -> dict:
+    return {
+        'rank':        rank,
+        'studentId':   row['studentId'],
+        'studentName': row.get('studentName', ''),
+        'xp':          row.get('xp', 0)
+    }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Roll-over / compaction
+# ─────────────────────────────────────────────────────────────────────────────
+def roll_over_xp_buckets(db) -> int:
+    """Compact every bucket older than the previous one.  Scheduled job; returns
+    the number of buckets compacted."""
+    try:
+        with board_lock(db, XP_ROLLOVER_BOARD, XP_ROLLOVER_LEASE_SECONDS):
+            return _roll_over(db)
+    except BoardLockTimeout:
+        return 0    # another worker is rolling over
+
+
+def _roll_over(db) -> int:
+    now       = datetime.datetime.utcnow()
+    compacted = 0
+    for period in PERIODS:
+        live = {bucket_key(period, now), _previous_bucket(period, now)}
+        for bucket in db.xpBuckets.distinct('bucket', {'period': period}):
+            if bucket not in live and _compact_bucket(db, period, bucket, now):
+                compacted += 1
+
+        # Bucket keys sort chronologically, so the oldest archives come first
+        stale = db.xpBucketArchive.find({'period': period}, {'_id': 1}) \
+                                  .sort([('bucket', DESCENDING)]).skip(XP_ARCHIVE_RETENTION)
+        stale_ids = [a['_id'] for a in stale]
+        if stale_ids:
+            db.xpBucketArchive.delete_many({'_id': {'$in': stale_ids}})
+    return compacted
+
+
+def _compact_bucket(db, period: str, bucket: str, now: datetime.datetime) -> bool:
+    """Archive one bucket's top-N, then delete its rows.  Returns False (and
+    leaves any existing archive alone) if the rows are already gone."""
+    rows = db.xpBuckets.find(
+        {'period': period, 'bucket': bucket},
+        {'studentId': 1, 'studentName': 1, 'xp': 1}
+    ).sort(_BOARD_ORDER).limit(XP_BOARD_SIZE)
+    entries = [_entry(rank, row) for rank, row in enumerate(rows, start=1)]
+    if not entries:
+        return False
+    db.xpBucketArchive.update_one(
+        {'period': period, 'bucket': bucket},
+        {'$set': {
+            'entries':      entries,
+            'participants': db.xpBuckets.count_documents({'period': period, 'bucket': bucket}),
+            'compactedAt':  now
+        }},
+        upsert=True
+    )
+    db.xpBuckets.delete_many({'period': period, 'bucket': bucket})
+    return True
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+#  Backfill from quizAttempts
+# ─────────────────────────────────────────────────────────────────────────────
+_DATE_FORMATS = {PERIOD_WEEK: '%G-W%V', PERIOD_MONTH: '%Y-%m'}
+
+
+def backfill_xp_buckets(db):
+    """Rebuild the live (current + previous) buckets from quizAttempts.
+    Used by backfill_xp_buckets.py; safe to re-run (rows are replaced)."""
+    now = datetime.datetime.utcnow()
+    for period in PERIODS:
+        live  = [_previous_bucket(period, now), bucket_key(period, now)]
+        since = now - datetime.timedelta(days=14 if period == PERIOD_WEEK else 62)
+        db.quizAttempts.aggregate([
+            {'$match': {'attemptedAt': {'$gte': since}, 'xpEarned': {'$gt': 0}}},
+            {'$set': {'bucket': {'$dateToString': {
+                'date': '$attemptedAt', 'format': _DATE_FORMATS[period]
+            }}}},
+            {'$match': {'bucket': {'$in': live}}},
+            {'$group': {
+                '_id':       {'bucket': '$bucket', 'studentId': '$studentId'},
+                'xp':        {'$sum': '$xpEarned'},
+                'updatedAt': {'$max': '$attemptedAt'}
+            }},
+            {'$lookup': {
+                'from':         'users',
+                'localField':   '_id.studentId',
+                'foreignField': '_id',
+                'pipeline':     [{'$project': {'name': 1}}],
+                'as':           'user'
+            }},
+            {'$project': {
+                '_id':         0,
+                'period':      {'$literal': period},
+                'bucket':      '$_id.bucket',
+                'studentId':   '$_id.studentId',
+                'studentName': {'$ifNull': [{'$first': '$user.name'}, '']},
+                'xp':          1,
+                'updatedAt':   1
+            }},
+            {'$merge': {
+                'into':           'xpBuckets',
+                'on':             ['period', 'bucket', 'studentId'],
+                'whenMatched':    'replace',
+                'whenNotMatched': 'insert'
+            }},
+        ], allowDiskUse=True)
@@ -0,0 +1 @@
+"""Unit tests.  Run from backend/:  python -m unittest discover -s tests -t ."""
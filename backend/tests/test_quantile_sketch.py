@@ -0,0 +1,93 @@
+"""QuantileSketch accuracy and merge arithmetic."""
+import random
+import unittest
+from unittest import mock
+
+from src.services import quantile_sketch
+from src.services.quantile_sketch import QuantileSketch
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_fraction_below_is_close_to_exact(self):
+        random.seed(3)
+        values = [int(random.expovariate(1 / 800)) for _ in range(5000)]
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.add(value)
+
+        for probe in (0, 1, 50, 400, 800, 2000, 10_000):
+            exact = (sum(v < probe for v in values) + sum(v == probe for v in values) / 2) / len(values)
+            # Values in the probe's bucket count half, so allow that bucket's share
+            self.assertAlmostEqual(sketch.fraction_below(probe), exact, delta=0.02)
+
+    def test_take_out_undoes_add(self):
+        sketch = QuantileSketch()
+        sketch.add(120)
+        sketch.add(120, -1)
+        self.assertEqual(sketch.counts, {})
+        self.assertEqual(len(sketch), 0)
+        self.assertEqual(sketch.fraction_below(120), 0.0)
+
+    def test_merge_equals_adding_everything_to_one_sketch(self):
+        a, b, both = QuantileSketch(), QuantileSketch(), QuantileSketch()
+        for value in range(0, 1000, 7):
+            a.add(value)
+            both.add(value)
+        for value in range(3, 3000, 11):
+            b.add(value)
+            both.add(value)
+        a.merge(b)
+        self.assertEqual(a.counts, both.counts)
+        self.assertEqual(a.fraction_below(500), both.fraction_below(500))
+
+    def test_signed_delta_carries_take_outs_into_the_merge(self):
+        persisted = QuantileSketch()
+        persisted.add(300)
+        delta = QuantileSketch(signed=True)
+        delta.add(300, -1)       # the value was added before the last persist
+        delta.add(450)
+        persisted.merge(delta)
+        self.assertEqual(persisted.counts, {persisted.bucket(450): 1})
+
+    def test_values_below_one_share_a_bucket(self):
+        sketch = QuantileSketch()
+        self.assertEqual(sketch.bucket(0), sketch.bucket(0.5))
+        self.assertLess(sketch.bucket(0), sketch.bucket(1))
+
+    def test_counts_round_trip_through_string_keys(self):
+        sketch = QuantileSketch()
+        for value in (0, 5, 5, 900):
+            sketch.add(value)
+        stored = {str(k): n for k, n in sketch.counts.items()}   # as persisted in Mongo
+        self.assertEqual(QuantileSketch(stored).counts, sketch.counts)
+
+
+class PersistSketchesTest(unittest.TestCase):
+
+    def setUp(self):
+        quantile_sketch._views.clear()
+        quantile_sketch._deltas.clear()
+
+    def test_failed_write_keeps_the_delta_for_the_next_run(self):
+        delta = QuantileSketch(signed=True)
+        delta.add(100)
+        delta.add(40, -1)
+        quantile_sketch._deltas['xp'] = delta
+        db = mock.MagicMock()
+        db.quantileSketches.update_one.side_effect = RuntimeError('write failed')
+
+        with self.assertRaises(RuntimeError):
+            quantile_sketch.persist_sketches(db)
+        self.assertEqual(quantile_sketch._deltas['xp'].counts, delta.counts)
+
+        db.quantileSketches.update_one.side_effect = None
+        db.quantileSketches.find_one.return_value = None
+        self.assertEqual(quantile_sketch.persist_sketches(db), 1)
+        inc = db.quantileSketches.update_one.call_args[0][1]['$inc']
+        self.assertEqual(inc, {f'counts.{k}': n for k, n in delta.counts.items()})
+        self.assertEqual(quantile_sketch._deltas, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""RankIndex against a plain sorted list."""
+import random
+import unittest
+
+from src.services.rank_index import RankIndex
+
+
+class RankIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(7)
+
+    def assertMatchesSorted(self, index, keys):
+        expected = sorted((key, member) for member, key in keys.items())
+        self.assertEqual(len(index), len(expected))
+        self.assertEqual(
+            [(rank, member) for rank, member, _value in index.top(len(expected) + 5)],
+            [(rank, member) for rank, (_key, member) in enumerate(expected, start=1)]
+        )
+        for rank, (_key, member) in enumerate(expected, start=1):
+            self.assertEqual(index.rank_of(member), rank)
+
+    def test_upsert_move_and_remove_keep_ranks_exact(self):
+        index, keys = RankIndex(), {}
+        for step in range(2000):
+            member = random.randrange(300)
+            if step % 5 == 4 and member in keys:
+                self.assertTrue(index.remove(member))
+                del keys[member]
+            else:
+                keys[member] = (-random.randrange(50), member)
+                index.upsert(member, keys[member], {'m': member})
+        self.assertMatchesSorted(index, keys)
+
+    def test_top_with_offset_pages_through_every_member(self):
+        index = RankIndex()
+        for member in range(25):
+            index.upsert(member, (member,))
+        pages = [index.top(10, offset) for offset in (0, 10, 20, 30)]
+        self.assertEqual([len(page) for page in pages], [10, 10, 5, 0])
+        self.assertEqual([rank for page in pages for rank, _m, _v in page], list(range(1, 26)))
+
+    def test_upsert_same_key_replaces_value_only(self):
+        index = RankIndex()
+        index.upsert('a', (1,), 'old')
+        index.upsert('a', (1,), 'new')
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.get('a'), 'new')
+
+    def test_missing_member(self):
+        index = RankIndex()
+        self.assertIsNone(index.rank_of('x'))
+        self.assertIsNone(index.get('x'))
+        self.assertFalse(index.remove('x'))
+        self.assertEqual(index.top(5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
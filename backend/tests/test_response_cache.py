@@ -0,0 +1,64 @@
+"""response_cache: hits, invalidation, TTL and the LRU cap."""
+import json
+import threading
+import unittest
+from unittest import mock
+
+from src.services import response_cache
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        response_cache._entries.clear()
+        response_cache._generations.clear()
+
+    def load(self, board, variant, value):
+        return json.loads(response_cache.cached_json(board, variant, lambda: value).get_data())
+
+    def test_hit_serves_the_first_load(self):
+        self.assertEqual(self.load('b', 1, {'v': 1}), {'v': 1})
+        self.assertEqual(self.load('b', 1, {'v': 2}), {'v': 1})
+
+    def test_invalidate_board_drops_only_that_board(self):
+        self.load('a', 1, 'a1')
+        self.load('b', 1, 'b1')
+        response_cache.invalidate_board('a')
+        self.assertEqual(self.load('a', 1, 'a2'), 'a2')
+        self.assertEqual(self.load('b', 1, 'b2'), 'b1')
+
+    def test_expired_entry_is_reloaded(self):
+        with mock.patch.object(response_cache, 'RESPONSE_CACHE_TTL_SECONDS', 0):
+            self.load('b', 1, 'old')
+            self.assertEqual(self.load('b', 1, 'new'), 'new')
+
+    def test_cap_evicts_least_recently_used(self):
+        with mock.patch.object(response_cache, 'RESPONSE_CACHE_MAX_ENTRIES', 3):
+            for variant in range(3):
+                self.load('b', variant, variant)
+            self.load('b', 0, 'unused')          # hit: 0 becomes most recent
+            self.load('b', 3, 3)                 # evicts 1
+            self.assertEqual(list(response_cache._entries), [('b', 2), ('b', 0), ('b', 3)])
+
+    def test_concurrent_misses_load_once(self):
+        calls, gate = [], threading.Event()
+
+        def loader():
+            calls.append(1)
+            gate.wait(1)
+            return 'v'
+
+        threads = [
+            threading.Thread(target=response_cache.cached_json, args=('b', 1, loader))
+            for _ in range(5)
+        ]
+        for t in threads:
+            t.start()
+        gate.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
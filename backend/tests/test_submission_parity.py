@@ -0,0 +1,123 @@
+"""
+submission_pipeline (applied by MongoDB) and apply_submission (Python) must
+agree on every rule.  Needs a MongoDB to run the update pipeline on: set
+TEST_MONGODB_URI (a throwaway database is created and dropped); skipped otherwise.
+"""
+import os
+import unittest
+
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument
+
+from src.models import (
+    BADGE_PERFECT, BADGE_QUICK, BADGE_MODULE_MASTER, BADGE_FIRST_STEP, BADGE_SPEED_DEMON,
+    BADGE_CONTEST_WINNER
+)
+from src.services.progress_service import submission_pipeline, apply_submission
+
+TEST_MONGODB_URI = os.getenv('TEST_MONGODB_URI')
+
+M1, M2, M3 = ObjectId(), ObjectId(), ObjectId()
+
+
+@unittest.skipUnless(TEST_MONGODB_URI, 'TEST_MONGODB_URI not set')
+class SubmissionParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(TEST_MONGODB_URI)
+        cls.db     = cls.client.get_database(f'test_submission_parity_{ObjectId()}')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.drop_database(cls.db.name)
+        cls.client.close()
+
+    def submit(self, user: dict, module_oid, score, total, time_taken) -> dict:
+        """Apply one attempt both ways; assert they agree and return the outcome."""
+        user_id = self.db.users.insert_one(dict(user)).inserted_id
+        before  = self.db.users.find_one_and_update(
+            {'_id': user_id},
+            submission_pipeline(module_oid, score, total, time_taken),
+            return_document=ReturnDocument.BEFORE
+        )
+        after   = self.db.users.find_one({'_id': user_id})
+        outcome = apply_submission(before, module_oid, score, total, time_taken)
+        python  = outcome['user']
+
+        self.assertEqual(after['totalAttempts'], python['totalAttempts'])
+        self.assertEqual(after['xp'], python['xp'])
+        self.assertEqual(after['level'], python['level'])
+        self.assertEqual(set(after['badges']), set(python['badges']))
+        self.assertEqual(after['completedModules'], python['completedModules'])
+        self.assertEqual(after['bestByModule'], python['bestByModule'])
+        self.assertFalse({'_firstCompletion', '_priorCompletedCount'} & set(after))
+        return outcome
+
+    # ── completion / XP ──────────────────────────────────────────────────────
+    def test_first_pass_of_a_new_student(self):
+        outcome = self.submit({}, M1, 8, 10, 300)
+        self.assertTrue(outcome['isFirstCompletion'])
+        self.assertEqual(outcome['xpEarned'], 40)
+        self.assertIn(BADGE_FIRST_STEP, outcome['badgesEarned'])
+
+    def test_pass_ratio_boundary(self):
+        self.assertTrue(self.submit({}, M1, 7, 10, 300)['isFirstCompletion'])
+        self.assertFalse(self.submit({}, M1, 6, 10, 300)['isFirstCompletion'])
+
+    def test_repeat_pass_earns_nothing(self):
+        outcome = self.submit({'completedModules': [M1], 'xp': 50, 'level': 1}, M1, 10, 10, 300)
+        self.assertFalse(outcome['isFirstCompletion'])
+        self.assertEqual(outcome['xpEarned'], 0)
+
+    def test_legacy_string_module_ids_count_as_completed(self):
+        outcome = self.submit({'completedModules': [str(M1), str(M2)]}, M1, 10, 10, 300)
+        self.assertFalse(outcome['isFirstCompletion'])
+
+    def test_first_step_only_for_the_first_module(self):
+        outcome = self.submit({'completedModules': [M2]}, M1, 10, 10, 300)
+        self.assertTrue(outcome['isFirstCompletion'])
+        self.assertNotIn(BADGE_FIRST_STEP, outcome['badgesEarned'])
+
+    def test_zero_total(self):
+        self.submit({}, M1, 0, 0, 0)
+
+    # ── level ────────────────────────────────────────────────────────────────
+    def test_level_threshold_exactly_reached(self):
+        outcome = self.submit({'xp': 75, 'level': 1}, M1, 5, 5, 300)
+        self.assertEqual(outcome['newLevel'], 2)
+
+    def test_level_one_below_threshold(self):
+        outcome = self.submit({'xp': 74, 'level': 1}, M1, 5, 5, 300)
+        self.assertEqual(outcome['newLevel'], 1)
+
+    # ── badges ───────────────────────────────────────────────────────────────
+    def test_time_badge_boundaries(self):
+        outcome = self.submit({}, M1, 6, 6, 60)          # 10 s per question, 60 s total
+        self.assertTrue({BADGE_PERFECT, BADGE_QUICK, BADGE_SPEED_DEMON} <= set(outcome['badgesEarned']))
+        outcome = self.submit({}, M1, 6, 6, 61)
+        self.assertFalse({BADGE_QUICK, BADGE_SPEED_DEMON} & set(outcome['badgesEarned']))
+
+    def test_module_master_at_exactly_the_ratio(self):
+        user    = {'bestByModule': {str(M2): 0.8, str(M3): 0.9}}
+        outcome = self.submit(user, M1, 8, 10, 300)
+        self.assertIn(BADGE_MODULE_MASTER, outcome['badgesEarned'])
+
+    def test_module_master_blocked_by_one_weak_module(self):
+        user    = {'bestByModule': {str(M2): 0.79, str(M3): 1.0}}
+        outcome = self.submit(user, M1, 10, 10, 300)
+        self.assertNotIn(BADGE_MODULE_MASTER, outcome['badgesEarned'])
+
+    def test_lower_score_keeps_the_best_ratio(self):
+        user    = {'bestByModule': {str(M1): 0.9}}
+        outcome = self.submit(user, M1, 1, 10, 300)
+        self.assertEqual(outcome['user']['bestByModule'][str(M1)], 0.9)
+
+    def test_existing_badges_are_kept(self):
+        outcome = self.submit({'badges': [BADGE_CONTEST_WINNER]}, M1, 1, 10, 300)
+        self.assertIn(BADGE_CONTEST_WINNER, outcome['user']['badges'])
+        self.assertEqual(outcome['badgesEarned'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
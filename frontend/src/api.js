@@ -11,6 +11,16 @@ API.interceptors.request.use(cfg => {
   return cfg
 })
 
+// Signed per-module unlock grants: remembered from unlock responses and sent
+// with the questions fetch so the backend can skip its unlock lookup.
+const grantKey = (moduleId) => `unlockGrant:${moduleId}`
+
+API.interceptors.response.use(res => {
+  const { unlockGrant, unlockStatus } = res.data || {}
+  if (unlockGrant && unlockStatus?.moduleId) localStorage.setItem(grantKey(unlockStatus.moduleId), unlockGrant)
+  return res
+})
+
 // ── Auth ──────────────────────────────────────────────────────────────────
 export const register = (data) => API.post('/auth/register', data)
 export const login = (data) => API.post('/auth/login', data)
@@ -19,7 +29,14 @@ export const login = (data) => API.post('/auth/login', data)
 export const getCourses = () => API.get('/courses')
 export const getAllModules = () => API.get('/modules')
 export const getModule = (id) => API.get(`/modules/${id}`)
-export const getQuestions = (id) => API.get(`/modules/${id}/questions`)
+export const getQuestions = (id) => {
+  const grant = localStorage.getItem(grantKey(id))
+  return API.get(`/modules/${id}/questions`, grant ? { headers: { 'X-Unlock-Grant': grant } } : undefined)
+    .then(res => {
+      if (res.data.unlockGrant) localStorage.setItem(grantKey(id), res.data.unlockGrant)
+      return res
+    })
+}
 export const submitQuiz = (id, data) => API.post(`/modules/${id}/submit`, data)
 
 // ── Student profile / progress ────────────────────────────────────────────
@@ -32,7 +49,7 @@ export const getContestQuestions = (contestId) => API.get(`/contests/${contestId
 export const joinContest = (id, data) => API.post(`/contests/join/${id}`, data)
 export const submitContest = (id, data) => API.post(`/contests/submit/${id}`, data)
 export const getContestResult = (cid, sid) => API.get(`/contests/result/${cid}/${sid}`)
-export const getContestLeaderboard = (id) => API.get(`/contests/leaderboard/${id}`)
+export const getContestLeaderboard = (id, params) => API.get(`/contests/leaderboard/${id}`, { params })
 
 // ── Global Leaderboard (public) ───────────────────────────────────────────
 export const getGlobalLeaderboard = () => API.get('/leaderboard/global')
@@ -76,5 +93,6 @@ export const rebuildLeaderboard = () => API.post('/superadmin/rebuild-leaderboar
 export const openModule       = (id)       => API.post(`/modules/${id}/open`)
 export const updateVideoProgress = (id, data) => API.post(`/modules/${id}/video/progress`, data)
 export const getUnlockStatus  = (id)       => API.get(`/modules/${id}/unlock-status`)
+export const getCourseUnlockStatus = (courseId) => API.get(`/courses/${courseId}/unlock-status`)
 
 export default API
@@ -12,6 +12,23 @@ import {
 } from '@mui/icons-material'
 import { getAdminStats, createModule, updateModule, deleteModule, createQuestion, updateQuestion, deleteQuestion, getAdminModuleQuestions, uploadPDF, generateModuleFromPDF, createContest, updateContest, deleteContest, getCourses, getAllModules } from '../api'
 
+// datetime-local inputs hold local wall-clock time; the API stores UTC ISO strings
+const toUtcIso = (local) => (local ? new Date(local).toISOString() : '')
+
+const toLocalInput = (iso) => {
+  if (!iso) return ''
+  // Stored values without an offset are UTC (see admin_routes._utc_timestamp)
+  const date = new Date(/[zZ]|[+-]\d\d:?\d\d$/.test(iso) ? iso : `${iso}Z`)
+  if (isNaN(date)) return ''
+  return new Date(date.getTime() - date.getTimezoneOffset() * 60000).toISOString().slice(0, 16)
+}
+
+const contestTimesToUtc = (form) => ({
+  ...form,
+  startTime: toUtcIso(form.startTime),
+  endTime: toUtcIso(form.endTime)
+})
+
 export default function AdminDashboard() {
   const [openDialog, setOpenDialog] = useState('')
   const [courses, setCourses] = useState([])
@@ -320,7 +337,7 @@ export default function AdminDashboard() {
   const handleCreateContest = async () => {
     try {
       await createContest({
-        ...contestForm,
+        ...contestTimesToUtc(contestForm),
         customQuestions: customContestQuestions
       })
       showSnackbar('Contest created successfully!')
@@ -336,8 +353,8 @@ export default function AdminDashboard() {
     setContestForm({
       title: contest.title,
       moduleIds: contest.moduleIds || [],
-      startTime: contest.startTime || '',
-      endTime: contest.endTime || '',
+      startTime: toLocalInput(contest.startTime),
+      endTime: toLocalInput(contest.endTime),
       durationMinutes: contest.durationMinutes || 30,
       marksPerQuestion: contest.marksPerQuestion || 1,
       negativeMarking: contest.negativeMarking || 0
@@ -347,7 +364,7 @@ export default function AdminDashboard() {
 
   const handleUpdateContest = async () => {
     try {
-      await updateContest(editingContest._id, contestForm)
+      await updateContest(editingContest._id, contestTimesToUtc(contestForm))
       showSnackbar('Contest updated successfully!')
       handleCloseDialog()
       await loadCourses()
@@ -2,7 +2,7 @@ import React, { useState, useEffect, useContext } from 'react'
 import {
     Container, Typography, Box, Paper, LinearProgress, Avatar, Chip,
     Table, TableBody, TableCell, TableContainer, TableHead, TableRow,
-    Tabs, Tab, Divider, Alert, IconButton, Tooltip, Grid, Card, CardContent
+    Tabs, Tab, Divider, Alert, IconButton, Tooltip, Grid, Card, CardContent, Button
 } from '@mui/material'
 import {
     EmojiEvents, TrendingUp, School, Refresh, Star,
@@ -162,8 +162,10 @@ function ContestTab({ userId }) {
     const [contests, setContests] = useState([])
     const [selectedContest, setSelectedContest] = useState(null)
     const [entries, setEntries] = useState([])
+    const [nextCursor, setNextCursor] = useState(null)
     const [loading, setLoading] = useState(true)
     const [lbLoading, setLbLoading] = useState(false)
+    const [moreLoading, setMoreLoading] = useState(false)
 
     useEffect(() => {
         getContests()
@@ -179,12 +181,29 @@ function ContestTab({ userId }) {
     const loadContest = (c) => {
         setSelectedContest(c)
         setLbLoading(true)
+        setNextCursor(null)
         getContestLeaderboard(c._id)
-            .then(r => setEntries(r.data.leaderboard || []))
+            .then(r => {
+                setEntries(r.data.leaderboard || [])
+                setNextCursor(r.data.nextCursor || null)
+            })
             .catch(() => setEntries([]))
             .finally(() => setLbLoading(false))
     }
 
+    // The board is paginated (submitted entries only) — follow nextCursor
+    const loadMore = () => {
+        if (!selectedContest || !nextCursor) return
+        setMoreLoading(true)
+        getContestLeaderboard(selectedContest._id, { cursor: nextCursor })
+            .then(r => {
+                setEntries(prev => [...prev, ...(r.data.leaderboard || [])])
+                setNextCursor(r.data.nextCursor || null)
+            })
+            .catch(() => { })
+            .finally(() => setMoreLoading(false))
+    }
+
     if (loading) return <LinearProgress sx={{ mt: 2 }} />
     if (contests.length === 0) return <Alert severity="info" sx={{ mt: 2 }}>No contests available yet.</Alert>
 
@@ -215,13 +234,12 @@ function ContestTab({ userId }) {
                                     <TableCell align="center"><Typography fontWeight={700}>Score</Typography></TableCell>
                                     <TableCell align="center"><Typography fontWeight={700}>Correct</Typography></TableCell>
                                     <TableCell align="center"><Typography fontWeight={700}>Time (s)</Typography></TableCell>
-                                    <TableCell align="center"><Typography fontWeight={700}>Status</Typography></TableCell>
                                 </TableRow>
                             </TableHead>
                             <TableBody>
                                 {entries.length === 0 ? (
                                     <TableRow>
-                                        <TableCell colSpan={6} align="center" sx={{ py: 4 }}>
+                                        <TableCell colSpan={5} align="center" sx={{ py: 4 }}>
                                             <Typography color="text.secondary">No submissions yet for this contest.</Typography>
                                         </TableCell>
                                     </TableRow>
@@ -253,19 +271,19 @@ function ContestTab({ userId }) {
                                             <TableCell align="center">
                                                 <Typography variant="body2">{e.timeTaken || '—'}</Typography>
                                             </TableCell>
-                                            <TableCell align="center">
-                                                <Chip
-                                                    label={e.isSubmitted ? 'Submitted' : 'Joined'}
-                                                    size="small"
-                                                    color={e.isSubmitted ? 'success' : 'warning'}
-                                                />
-                                            </TableCell>
                                         </TableRow>
                                     )
                                 })}
                             </TableBody>
                         </Table>
                     </TableContainer>
+                    {nextCursor && (
+                        <Box sx={{ display: 'flex', justifyContent: 'center', p: 2 }}>
+                            <Button variant="outlined" onClick={loadMore} disabled={moreLoading}>
+                                {moreLoading ? 'Loading…' : 'Load more'}
+                            </Button>
+                        </Box>
+                    )}
                 </Paper>
             )}
         </>